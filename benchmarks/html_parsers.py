@@ -0,0 +1,76 @@
+"""Measures how many pages per second each HTML parser backend can clean and extract text and metadata from.
+
+The corpus is generated from a fixed seed, so results are comparable between runs (and machines). Run from the
+repository root with `memoria` importable, e.g.:
+
+    python -m benchmarks.html_parsers --pages 500
+"""
+import random
+import time
+from argparse import ArgumentParser
+
+from memoria.html import clean_html, extract_meta, get_backend
+
+WORDS = ('memoria', 'history', 'search', 'index', 'browser', 'page', 'content', 'parser', 'lorem', 'ipsum', 'dolor',
+         'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod', 'tempor')
+
+
+def _sentence(rand: random.Random, length: int) -> str:
+    return ' '.join(rand.choice(WORDS) for _ in range(length))
+
+
+def make_page(rand: random.Random) -> bytes:
+    """A page shaped like a typical article: a header, navigation, some boilerplate and a main body."""
+    paragraphs = ''.join(f'<p class="{rand.choice(("lead", "body", "noprint"))}">{_sentence(rand, rand.randint(20, 80))}'
+                         f' <a href="/{rand.randint(0, 999)}">{_sentence(rand, 3)}</a></p>\n'
+                         for _ in range(rand.randint(10, 60)))
+    links = ''.join(f'<li><a href="/section/{i}">{_sentence(rand, 2)}</a></li>' for i in range(rand.randint(5, 30)))
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{_sentence(rand, 6)}</title>'
+            f'<meta name="description" content="{_sentence(rand, 15)}"><meta name="author" content="{_sentence(rand, 2)}">'
+            f'<link rel="shortcut icon" href="/favicon.ico"><style>body {{ margin: 0; }}</style>'
+            f'<script>var x = {rand.randint(0, 999)};</script></head><body>'
+            f'<header><h1>{_sentence(rand, 4)}</h1></header><nav><ul>{links}</ul></nav>'
+            f'<!-- {_sentence(rand, 10)} --><div id="Content"><article><h2>{_sentence(rand, 8)}</h2>{paragraphs}'
+            f'<form><input type="text" name="q"><a role="button" href="#">{_sentence(rand, 1)}</a></form></article>'
+            f'</div><footer>{_sentence(rand, 10)}</footer></body></html>').encode()
+
+
+def run(backend_name: str, corpus: list[bytes], single_parse: bool) -> float:
+    """Clean each page and extract its text and metadata, returning pages per second. Unless `single_parse`, this is
+    done as filter and extractor plugins without access to each other's work would: cleaning a copy of the tree, and
+    parsing the page again for its metadata."""
+    backend = get_backend(backend_name)
+    start = time.perf_counter()
+    for page in corpus:
+        root = backend.parse(page, 'utf-8')
+        if single_parse:
+            extract_meta(backend, root, 'https://example.com/')
+            backend.text(clean_html(backend, root))
+        else:
+            backend.text(clean_html(backend, backend.copy(root)))
+            extract_meta(backend, backend.parse(page, 'utf-8'), 'https://example.com/')
+    return len(corpus) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=200, help='The number of pages in the corpus.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('backends', nargs='*', default=['html.parser', 'lxml', 'selectolax'])
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    corpus = [make_page(rand) for _ in range(args.pages)]
+    print(f'{len(corpus)} pages, {sum(map(len, corpus)) / 1024 / 1024:.1f} MiB')
+
+    for name in args.backends:
+        try:
+            rates = [run(name, corpus, single_parse) for single_parse in (False, True)]
+        except ImportError as ex:
+            print(f'{name:>12}: skipped ({ex})')
+            continue
+        print(f'{name:>12}: {rates[0]:8.1f} pages/s, {rates[1]:8.1f} pages/s single-parse')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Measures end-to-end ingest throughput without the internet or Elasticsearch.
+
+Serves a synthetic corpus from a local stand-in origin, uploads a generated Firefox history database through
+`api_upload_db` (or, with `--direct`, queues its URLs and runs `do_download` itself), and indexes into an in-process
+fake Elasticsearch. Reports pages per second, per-URL latency (from the first request for a page until its history was
+recorded) and peak memory use. Run from the repository root, e.g.:
+
+    python -m benchmarks.ingest --pages 2000 --hosts 8 --latency 0.05
+
+Other Memoria settings (like `MEMORIA_IMPORT_THREADS`) can be set through the environment as usual.
+"""
+import asyncio
+import multiprocessing as mp
+import os
+import resource
+import statistics
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+
+async def _allow(hosts: list[str]) -> None:
+    """Allowlist every page of the origin's hosts, so that uploads don't filter them out."""
+    from memoria.db_clients import create_sql_client
+    from memoria.model.orm.allowlist import AllowlistHost, AllowlistRule
+
+    async with create_sql_client() as session:
+        async with session.begin():
+            for host in hosts:
+                session.add(
+                    AllowlistHost(hostname=host, allowed=True, rules=[AllowlistRule(plugin_id='Prefix', value='/')]))
+
+
+async def _upload(places: Path) -> None:
+    import httpx
+
+    from memoria.downloader import wait_for_downloader
+    from memoria.web import APP
+
+    async with APP.router.lifespan_context(APP):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=APP), base_url='http://memoria') as client:
+            resp = await client.post('/api/v1/upload_db', files={'file': ('places.sqlite', places.read_bytes())})
+            resp.raise_for_status()
+        print(f"Uploaded: {resp.json()}")
+        await wait_for_downloader()
+
+
+async def _direct(urls: list[str]) -> None:
+    from memoria.db_clients import create_sql_client
+    from memoria.downloader import do_download
+    from memoria.logic import crawl_jobs
+    from memoria.model.imported_history import ImportedHistory
+
+    async with create_sql_client() as session:
+        await crawl_jobs.enqueue(session, (ImportedHistory(url=url, title=f'Page {i}', last_visit=datetime.now())
+                                           for i, url in enumerate(urls)))
+    await do_download()
+
+
+async def _scraped() -> dict[str, datetime]:
+    from sqlalchemy import select
+
+    from memoria.db_clients import create_sql_client
+    from memoria.model.orm.history import History
+
+    async with create_sql_client() as session:
+        async with session.begin():
+            rows = await session.execute(select(History.url, History.last_scrape).where(History.last_scrape.is_not(None)))
+            return {url: last_scrape for url, last_scrape in rows}
+
+
+async def run(args: Namespace, workdir: Path) -> None:
+    # These import Memoria, so they're only imported once its settings are in place.
+    from .fake_es import install
+    from .origin import Origin
+    from .places import make_places
+    install()
+
+    async with Origin(args.hosts, args.port, args.latency, args.size, seed=args.seed) as origin:
+        urls = origin.urls(args.pages)
+        await _allow(origin.hosts)
+
+        start = time.perf_counter()
+        if args.direct:
+            await _direct(urls)
+        else:
+            make_places(places := workdir / 'places.sqlite', urls, args.seed)
+            start = time.perf_counter()
+            await _upload(places)
+        elapsed = time.perf_counter() - start
+
+        scraped = await _scraped()
+        latencies = [(scraped[url] - requested).total_seconds() for url, requested in origin.requested.items()
+                     if url in scraped]
+
+    # Peak resident set size, in KiB (except on macOS, where it's in bytes).
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 1024 / 1024
+
+    print(f"{len(scraped):,} of {len(urls):,} pages in {elapsed:.2f}s: {len(scraped) / elapsed:.1f} pages/s")
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(f"Per-URL latency: p50 {percentiles[49]:.3f}s, p99 {percentiles[98]:.3f}s")
+    print(f"Peak RSS: {own:.1f} MiB (this process), {children:.1f} MiB (largest worker)")
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=1000)
+    parser.add_argument('--hosts', type=int, default=4, help='Origin hosts (loopback addresses) to spread pages across.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Average origin response time, in seconds.')
+    parser.add_argument('--size', type=int, default=20_000, help='Minimum page size, in bytes.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--direct', action='store_true', help='Queue crawl jobs directly, instead of uploading.')
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix='memoria-benchmark-') as workdir:
+        # Settings are read on import, so these must be set first.
+        os.environ['MEMORIA_DATABASE_URI'] = f'sqlite+aiosqlite:///{workdir}/memoria.db'
+        os.environ['MEMORIA_ARCHIVE_DIR'] = f'{workdir}/archive'
+        # With only a few local hosts, politeness delays would be all that's measured.
+        os.environ.setdefault('MEMORIA_HOST_DELAY', '0')
+        # Logging every page slows ingest down noticeably.
+        os.environ.setdefault('MEMORIA_LOG_LEVEL', 'WARNING')
+
+        # The fake Elasticsearch is installed by patching, which only forked import workers inherit.
+        mp.set_start_method('fork', force=True)
+        asyncio.run(run(args, Path(workdir)))
+
+
+if __name__ == '__main__':
+    main()
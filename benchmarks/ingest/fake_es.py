@@ -0,0 +1,69 @@
+import json
+from typing import Any
+
+from elastic_transport import ApiResponseMeta, BaseAsyncNode, HttpHeaders
+from elastic_transport._node._base import NodeApiResponse
+
+_HEADERS = HttpHeaders({'x-elastic-product': 'Elasticsearch', 'content-type': 'application/json'})
+
+
+class FakeNode(BaseAsyncNode):
+    """An Elasticsearch "node" that answers the handful of requests Memoria makes in process, without any network.
+
+    Documents are kept per process (so import workers each have their own index), and only their IDs are kept."""
+    _indices: set[str] = set()
+    _ids: dict[str, set[str]] = {}
+
+    async def perform_request(self, method: str, target: str, body: bytes | None = None, headers=None,
+                              request_timeout=None) -> NodeApiResponse:
+        path = target.partition('?')[0].strip('/').split('/')
+        status, response = self._handle(method, path, body)
+        meta = ApiResponseMeta(status=status, http_version='1.1', headers=_HEADERS, duration=0.0, node=self.config)
+        return NodeApiResponse(meta, b'' if method == 'HEAD' else json.dumps(response).encode())
+
+    async def close(self) -> None:
+        pass
+
+    def _handle(self, method: str, path: list[str], body: bytes | None) -> tuple[int, Any]:
+        match method, path:
+            case _, ['_bulk']:
+                return 200, self._bulk(body or b'')
+            case 'HEAD', [index]:
+                return (200 if index in self._indices else 404), None
+            case 'PUT', [index]:
+                self._indices.add(index)
+                return 200, {'acknowledged': True, 'index': index}
+            case _, [index, '_mget']:
+                ids = self._ids.get(index, set())
+                return 200, {'docs': [{'_id': id_, 'found': id_ in ids} for id_ in json.loads(body or b'{}')['ids']]}
+            case _, [index, '_count']:
+                return 200, {'count': len(self._ids.get(index, ()))}
+            case _, [index, '_search']:
+                hits = [{'_index': index, '_id': id_, '_score': 1.0} for id_ in self._ids.get(index, ())]
+                return 200, {'_scroll_id': 'all', 'hits': {'total': {'value': len(hits)}, 'hits': hits}}
+            case 'DELETE', ['_search', 'scroll']:
+                return 200, {'succeeded': True, 'num_freed': 1}
+            case _, ['_search', 'scroll']:
+                return 200, {'_scroll_id': 'all', 'hits': {'hits': []}}
+        return 400, {'error': f'{method} /{"/".join(path)} is not supported by the fake Elasticsearch.'}
+
+    def _bulk(self, body: bytes) -> dict[str, Any]:
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = []
+        for action, _ in zip(lines[::2], lines[1::2]):
+            index, id_ = action['index']['_index'], action['index']['_id']
+            self._ids.setdefault(index, set()).add(id_)
+            items.append({'index': {'_index': index, '_id': id_, 'status': 201, 'result': 'created'}})
+        return {'errors': False, 'took': 0, 'items': items}
+
+
+def install() -> None:
+    """Make Memoria's Elasticsearch clients use `FakeNode`. Import workers are forked, so they inherit this."""
+    from memoria import db_clients
+
+    create = db_clients.create_elasticsearch_client
+
+    async def create_elasticsearch_client(host: str, **kwargs):
+        return await create(host, node_class=FakeNode, **kwargs)
+
+    db_clients.create_elasticsearch_client = create_elasticsearch_client
@@ -0,0 +1,56 @@
+import asyncio
+import random
+from contextlib import AbstractAsyncContextManager
+from datetime import datetime
+
+from aiohttp import web
+
+from ..html_parsers import WORDS, make_page
+
+
+class Origin(AbstractAsyncContextManager):
+    """A local stand-in for the web: serves `/page/{n}` from `hosts` loopback addresses (`127.0.0.1`, `127.0.0.2`, ...),
+    each response taking about `latency` seconds. Pages are built from a fixed corpus of pages of at least `size` bytes,
+    but every page is unique (so none are skipped as duplicates).
+
+    The time each page was first requested is kept in `requested`."""
+
+    def __init__(self, hosts: int, port: int, latency: float, size: int, corpus: int = 100, seed: int = 0) -> None:
+        self.hosts = [f'127.0.0.{i}' for i in range(1, hosts + 1)]
+        self.port = port
+        self.latency = latency
+        self.requested: dict[str, datetime] = {}
+        self._rand = random.Random(seed)
+        self._corpus = [self._make_page(size) for _ in range(corpus)]
+        self._runner: web.AppRunner | None = None
+
+    def _make_page(self, size: int) -> str:
+        page = make_page(self._rand).decode()
+        filler: list[str] = []
+        while len(page) + sum(map(len, filler)) < size:
+            filler.append(f'<p>{" ".join(self._rand.choices(WORDS, k=50))}</p>')
+        return page.replace('</article>', ''.join(filler) + '</article>', 1)
+
+    def urls(self, count: int) -> list[str]:
+        return [f'http://{self.hosts[i % len(self.hosts)]}:{self.port}/page/{i}' for i in range(count)]
+
+    async def _page(self, request: web.Request) -> web.Response:
+        self.requested.setdefault(f'http://{request.host}{request.path_qs}', datetime.now())
+        n = int(request.match_info['n'])
+        if self.latency:
+            await asyncio.sleep(self.latency * self._rand.uniform(0.5, 1.5))
+        body = self._corpus[n % len(self._corpus)].replace('<article>', f'<article><h1>Page {n}</h1>', 1)
+        return web.Response(text=body, content_type='text/html')
+
+    async def __aenter__(self) -> 'Origin':
+        app = web.Application()
+        app.router.add_get('/page/{n}', self._page)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        for host in self.hosts:
+            await web.TCPSite(self._runner, host, self.port).start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        assert self._runner is not None
+        await self._runner.cleanup()
@@ -0,0 +1,22 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+_SCHEMA = """
+CREATE TABLE moz_places (id INTEGER PRIMARY KEY, url LONGVARCHAR, title LONGVARCHAR, description TEXT);
+CREATE TABLE moz_historyvisits (id INTEGER PRIMARY KEY, place_id INTEGER, visit_date INTEGER);
+"""
+
+
+def make_places(path: Path, urls: list[str], seed: int = 0) -> None:
+    """Write a Firefox `places.sqlite` with a place (visited one to five times in the last month) for each URL."""
+    rand = random.Random(seed)
+    now = datetime.now()
+    with sqlite3.connect(path) as con:
+        con.executescript(_SCHEMA)
+        con.executemany('INSERT INTO moz_places (id, url, title, description) VALUES (?, ?, ?, NULL)',
+                        ((i, url, f'Page {i}') for i, url in enumerate(urls, start=1)))
+        con.executemany('INSERT INTO moz_historyvisits (place_id, visit_date) VALUES (?, ?)',
+                        ((i, int((now - timedelta(days=rand.uniform(1, 30))).timestamp() * 1_000_000))
+                         for i in range(1, len(urls) + 1) for _ in range(rand.randint(1, 5))))
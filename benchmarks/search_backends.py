@@ -0,0 +1,156 @@
+"""Compares how fast, and with how much memory, each search backend answers queries.
+
+Indexes a synthetic corpus (with a Zipf-distributed vocabulary, like natural language) into each backend, then times
+random queries of one to three words. SQLite uses a temporary database; Elasticsearch uses a temporary index on the
+configured `elastic_host`, and is skipped if it can't be reached. For Elasticsearch, the same queries are also timed as
+Memoria used to make them (with `explain`, for per-term scores). Run from the repository root, e.g.:
+
+    python -m benchmarks.search_backends --pages 20000 --queries 500
+"""
+import asyncio
+import os
+import random
+import resource
+import statistics
+import string
+import sys
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+from hashlib import sha256
+from itertools import accumulate
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+
+from elastic_transport import TransportError
+
+_INDEX = 'memoria-benchmark-pages'
+_WARMUP = 10
+
+
+def _peak_rss() -> float:
+    """This process's peak resident set size, in MiB. Only ever grows, so only increases can be attributed."""
+    # In KiB, except on macOS (where it's in bytes).
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def make_corpus(rand: random.Random, pages: int, queries: int,
+                vocabulary: int) -> tuple[list[tuple[str, dict[str, Any]]], list[str]]:
+    """Generate `pages` documents, and `queries` queries, from `vocabulary` made-up words."""
+    words = [''.join(rand.choices(string.ascii_lowercase, k=rand.randint(3, 10))) for _ in range(vocabulary)]
+    weights = list(accumulate(1 / rank for rank in range(1, vocabulary + 1)))
+    corpus = []
+    for i in range(pages):
+        text = ' '.join(rand.choices(words, cum_weights=weights, k=rand.randint(200, 2_000)))
+        corpus.append((sha256(text.encode()).hexdigest(), {
+            'url': f'https://example.com/{i}',
+            'timestamp': datetime.now(),
+            'title': f'Page {i}',
+            'text': text
+        }))
+    return corpus, [' '.join(rand.choices(words, cum_weights=weights, k=rand.randint(1, 3))) for _ in range(queries)]
+
+
+async def time_queries(queries: list[str], search) -> None:
+    """Time `search` for each query, after a few warm-up queries."""
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        await search(query)
+        if i >= _WARMUP:
+            latencies.append(time.perf_counter() - start)
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f'  {len(latencies):,} queries: p50 {percentiles[49] * 1000:.2f}ms, p99 {percentiles[98] * 1000:.2f}ms, '
+          f'{len(latencies) / sum(latencies):.0f} queries/s')
+
+
+async def run(backend, corpus: list[tuple[str, dict[str, Any]]], queries: list[str], refresh=None) -> None:
+    start = time.perf_counter()
+    indexed = await asyncio.gather(*(backend.index(id_, document) for id_, document in corpus))
+    if refresh is not None:
+        await refresh()
+    elapsed = time.perf_counter() - start
+    print(f'  indexed {sum(indexed):,} pages in {elapsed:.1f}s ({sum(indexed) / elapsed:.0f} pages/s)')
+
+    await time_queries(queries, lambda query: backend.search(query, 25))
+
+
+async def run_sqlite(corpus: list[tuple[str, dict[str, Any]]], queries: list[str], database: Path) -> None:
+    from memoria.backends.sqlite import SqliteBackend
+
+    before = _peak_rss()
+    async with SqliteBackend() as backend:
+        await run(backend, corpus, queries)
+    print(f'  database {database.stat().st_size / 1024 / 1024:.1f} MiB, '
+          f'peak RSS of this process grew by {_peak_rss() - before:.1f} MiB')
+
+
+async def run_elasticsearch(corpus: list[tuple[str, dict[str, Any]]], queries: list[str]) -> None:
+    from elasticsearch import AsyncElasticsearch
+
+    from memoria.backends.elasticsearch import ElasticsearchBackend
+    from memoria.elasticsearch import PAGES_INDEX_KWARGS
+    from memoria.settings import SETTINGS
+
+    basic_auth = None
+    if SETTINGS.elastic_password is not None:
+        basic_auth = (SETTINGS.elastic_user, SETTINGS.elastic_password)
+    async with AsyncElasticsearch(SETTINGS.elastic_host, basic_auth=basic_auth) as es:
+        await es.options(ignore_status=404).indices.delete(index=_INDEX)
+        await es.indices.create(index=_INDEX, **PAGES_INDEX_KWARGS)
+        try:
+            async with ElasticsearchBackend(create_indexes=False, index=_INDEX) as backend:
+                await run(backend, corpus, queries, refresh=lambda: es.indices.refresh(index=_INDEX))
+
+            async def explained(query: str) -> None:
+                await es.search(index=_INDEX, query={'match': {'text': query}}, explain=True, size=25,
+                                source_includes=('title', 'url', 'timestamp', 'author', 'favicon', 'description'))
+
+            print('  with `explain` (as before):')
+            await time_queries(queries, explained)
+            store = (await es.indices.stats(index=_INDEX, metric='store'))['_all']['primaries']['store']
+            nodes = (await es.nodes.stats(metric='jvm'))['nodes'].values()
+        finally:
+            await es.indices.delete(index=_INDEX)
+    heap = sum(node['jvm']['mem']['heap_used_in_bytes'] for node in nodes) / 1024 / 1024
+    committed = sum(node['jvm']['mem']['heap_committed_in_bytes'] + node['jvm']['mem']['non_heap_committed_in_bytes']
+                    for node in nodes) / 1024 / 1024
+    print(f'  index {store["size_in_bytes"] / 1024 / 1024:.1f} MiB, '
+          f'JVM heap {heap:.1f} MiB used ({committed:.1f} MiB committed, heap and non-heap)')
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=10_000, help='The number of pages in the corpus.')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--vocabulary', type=int, default=50_000, help='The number of distinct words in the corpus.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('backends', nargs='*', default=['sqlite', 'elasticsearch'])
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    corpus, queries = make_corpus(rand, args.pages, _WARMUP + args.queries, args.vocabulary)
+    print(f'{len(corpus):,} pages, {sum(len(doc["text"]) for _, doc in corpus) / 1024 / 1024:.1f} MiB of text')
+
+    with TemporaryDirectory(prefix='memoria-benchmark-') as workdir:
+        database = Path(workdir) / 'memoria.db'
+        # Settings are read on import, so this must be set first.
+        os.environ['MEMORIA_DATABASE_URI'] = f'sqlite+aiosqlite:///{database}'
+
+        for name in args.backends:
+            print(f'{name}:')
+            try:
+                match name:
+                    case 'sqlite':
+                        asyncio.run(run_sqlite(corpus, queries, database))
+                    case 'elasticsearch':
+                        asyncio.run(run_elasticsearch(corpus, queries))
+                    case _:
+                        print('  unknown backend')
+            except TransportError as ex:
+                print(f'  skipped ({ex})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import gzip
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from tempfile import mkstemp
+from typing import Iterator
+
+from .plugins.processing import Result
+
+_COMPRESS_LEVEL = 6
+"""Compression is done on the import processes' event loops (in a thread), so this trades a little size for speed."""
+
+
+@dataclass(slots=True, kw_only=True)
+class ArchivedPage:
+    """Downloaded content as it was stored, along with what's needed to process it again."""
+    id: str
+    url: str
+    request_url: str
+    title: str | None
+    timestamp: datetime
+    """When the content was downloaded."""
+    content: bytes
+    content_type: str
+    encoding: str | None
+
+    def result(self) -> Result:
+        """The content as if it had just been downloaded."""
+        return Result(url=self.url,
+                      request_url=self.request_url,
+                      content=self.content,
+                      content_type=self.content_type,
+                      encoding=self.encoding,
+                      content_hash=self.id)
+
+
+class Archive:
+    """A content-addressed store of raw downloaded content, so that pages can be processed again (e.g. after changing
+    the filter stack or extractor) without downloading them again.
+
+    Content is kept gzip-compressed under its SHA-256 hex digest (the ID it is indexed under), preceded by a line of
+    JSON holding its URLs, content type, encoding, title and download time. Content downloaded from several URLs is only
+    kept once, with the first of them. Files are written under a temporary name and then renamed, so several processes
+    can add to the same archive, and readers never see a partial file."""
+
+    def __init__(self, root: Path | str) -> None:
+        self._root = Path(root)
+
+    def _path(self, id_: str) -> Path:
+        # Spread over subdirectories, so that no single directory grows too large.
+        return self._root / id_[:2] / f'{id_}.gz'
+
+    def __contains__(self, id_: str) -> bool:
+        return self._path(id_).exists()
+
+    def __iter__(self) -> Iterator[str]:
+        """The ID of every archived page."""
+        if not self._root.is_dir():
+            return
+        for path in self._root.glob('*/*.gz'):
+            yield path.name.removesuffix('.gz')
+
+    def put(self, id_: str, result: Result, title: str | None, timestamp: datetime) -> bool:
+        """Store downloaded content (which hashes to `id_`), unless it already is. Returns whether it was stored."""
+        path = self._path(id_)
+        if path.exists():
+            return False
+        content = result.content
+        encoding = result.encoding
+        if isinstance(content, str):
+            content, encoding = content.encode(), 'utf-8'
+        assert isinstance(content, bytes)
+        header = {
+            'url': result.url,
+            'request_url': result.request_url,
+            'title': title,
+            'timestamp': timestamp.isoformat(),
+            'content_type': result.content_type,
+            'encoding': encoding,
+        }
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp = mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with open(fd, 'wb') as file, gzip.GzipFile(fileobj=file, mode='wb', compresslevel=_COMPRESS_LEVEL,
+                                                       mtime=0) as gz:
+                gz.write(json.dumps(header).encode())
+                gz.write(b'\n')
+                gz.write(content)
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+        return True
+
+    def get(self, id_: str) -> ArchivedPage:
+        """Read archived content. Raises `LookupError` if there is none with this ID."""
+        try:
+            data = gzip.decompress(self._path(id_).read_bytes())
+        except FileNotFoundError:
+            raise LookupError("No archived content with that ID exists.") from None
+        header, _, content = data.partition(b'\n')
+        meta = json.loads(header)
+        return ArchivedPage(id=id_,
+                            url=meta['url'],
+                            request_url=meta['request_url'],
+                            title=meta['title'],
+                            timestamp=datetime.fromisoformat(meta['timestamp']),
+                            content=content,
+                            content_type=meta['content_type'],
+                            encoding=meta['encoding'])
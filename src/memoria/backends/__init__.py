@@ -0,0 +1,97 @@
+import json
+import math
+from abc import ABC, abstractmethod
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from hashlib import blake2b
+from contextlib import AbstractAsyncContextManager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Self
+
+from ..settings import SETTINGS
+
+if TYPE_CHECKING:
+    from ..model.explanation import Explanation
+    from ..model.search_result import SearchResults
+
+
+class SearchBackend(AbstractAsyncContextManager, ABC):
+    """Where pages are indexed, and searched. Pages are identified by the hash of their content.
+
+    Must be entered before use. Indexing and existence checks may be batched, so concurrent callers are encouraged."""
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *_, **__) -> bool | None:
+        return None
+
+    @abstractmethod
+    async def index(self, id_: str, document: dict[str, Any]) -> bool:
+        """Index `document` (holding at least a `url`, `timestamp`, `title` and `text`) in place of any page with the
+        same ID, returning whether it was indexed successfully."""
+
+    @abstractmethod
+    async def exists(self, id_: str) -> bool:
+        """Whether a page with this ID has been indexed."""
+
+    @abstractmethod
+    async def count(self) -> int:
+        """The number of indexed pages."""
+
+    @abstractmethod
+    def page_ids(self) -> AsyncIterator[str]:
+        """Iterate over the ID of every indexed page."""
+
+    @abstractmethod
+    async def search(self, query: str, size: int, cursor: str | None = None) -> 'SearchResults':
+        """Up to `size` of the pages best matching `query`, best first, continuing from the `cursor` of a previous page
+        of results. Their `explanation` (if set) holds the contribution of each of the query's terms to their score.
+        Raises `ValueError` if `cursor` is invalid."""
+
+    @abstractmethod
+    async def explain(self, id_: str, query: str) -> 'Explanation':
+        """How a page's score for `query` is computed. Raises `LookupError` if there is no such page."""
+
+    @abstractmethod
+    async def get_preview(self, id_: str) -> str:
+        """The preview of a page. Raises `LookupError` if there is no such page."""
+
+
+def _query_hash(query: str) -> str:
+    return blake2b(' '.join(query.lower().split()).encode(), digest_size=8).hexdigest()
+
+
+def encode_cursor(query: str, state: dict[str, Any]) -> str:
+    """Make an opaque cursor (safe to put in URLs) holding `state`, for the results of `query`."""
+    state = {**state, 'query': _query_hash(query)}
+    return urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(query: str, cursor: str) -> dict[str, Any]:
+    """The state held by a cursor made by `encode_cursor` for the results of `query`. Raises `ValueError` if it wasn't
+    made by it, or was made for another query."""
+    try:
+        state = json.loads(urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("Invalid cursor.") from None
+    if not isinstance(state, dict) or state.pop('query', None) != _query_hash(query):
+        raise ValueError("Invalid cursor.")
+    return state
+
+
+def is_number(value: Any) -> bool:
+    """Whether `value` (from a decoded cursor) is a finite number."""
+    return isinstance(value, int | float) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def create_search_backend(create_indexes: bool = True) -> SearchBackend:
+    """Create the search backend chosen by the `search_backend` setting. With `create_indexes`, any missing indexes
+    are created when it is entered (which, for Elasticsearch, requires it to be reachable)."""
+    match SETTINGS.search_backend:
+        case 'elasticsearch':
+            from .elasticsearch import ElasticsearchBackend
+            return ElasticsearchBackend(create_indexes)
+        case 'sqlite':
+            from .sqlite import SqliteBackend
+            return SqliteBackend()
+        case other:
+            raise ValueError(f"Unknown search backend `{other}`, expected `elasticsearch` or `sqlite`.")
@@ -0,0 +1,262 @@
+from contextlib import AsyncExitStack
+from logging import getLogger
+from typing import TYPE_CHECKING, Any, AsyncIterator, Self
+from urllib.parse import urlparse
+
+from ..metrics import ELASTICSEARCH_SECONDS
+from ..model.explanation import Explanation
+from ..model.search_result import Result, SearchResults
+from ..settings import SETTINGS
+from . import SearchBackend, decode_cursor, encode_cursor, is_number
+
+if TYPE_CHECKING:
+    from elasticsearch import AsyncElasticsearch
+
+    from ..elasticsearch import BulkIndexer, ExistsChecker
+
+_LOG = getLogger(__spec__.name)
+
+_SOURCE_FIELDS = ('title', 'url', 'timestamp', 'author', 'favicon', 'description')
+_JSON_HEADERS = {'accept': 'application/json', 'content-type': 'application/json'}
+_PIT_KEEP_ALIVE = '1m'
+"""How long a search's point in time is kept after each page of its results is fetched. Searches continued after it
+expires carry on in a new one."""
+
+
+def _query(query: str) -> dict[str, Any]:
+    """Match pages with any of the query's words (scored like a single `match` query), with a clause named after each
+    word so that the contribution of each can be told apart."""
+    # The analyzer lowercases, so words differing only in case are the same term.
+    words = dict.fromkeys(word.lower() for word in query.split())
+    return {'bool': {'should': [{'match': {'text': {'query': word, '_name': word}}} for word in words]}}
+
+
+def _explanation(explanation: dict[str, Any]) -> Explanation:
+    return Explanation(value=explanation['value'],
+                       description=explanation['description'],
+                       details=[_explanation(detail) for detail in explanation.get('details', ())])
+
+
+class ElasticsearchBackend(SearchBackend):
+    """Indexes pages into, and searches, an Elasticsearch index."""
+
+    def __init__(self, create_indexes: bool = True, index: str = 'pages') -> None:
+        self._create_indexes = create_indexes
+        self._index = index
+        self._stack: AsyncExitStack | None = None
+        self._es: 'AsyncElasticsearch | None' = None
+        self._indexer: 'BulkIndexer | None' = None
+        self._exists: 'ExistsChecker | None' = None
+        self._highlighter: str | None = None
+
+    async def __aenter__(self) -> Self:
+        from elasticsearch import AsyncElasticsearch
+
+        from ..db_clients import create_elasticsearch_client
+        from ..elasticsearch import BulkIndexer, ExistsChecker
+
+        basic_auth = None
+        if SETTINGS.elastic_password is not None:
+            basic_auth = (SETTINGS.elastic_user, SETTINGS.elastic_password)
+
+        async with AsyncExitStack() as stack:
+            if self._create_indexes:
+                es = await create_elasticsearch_client(SETTINGS.elastic_host, basic_auth=basic_auth)
+            else:
+                es = AsyncElasticsearch(SETTINGS.elastic_host, basic_auth=basic_auth)
+            self._es = await stack.enter_async_context(es)
+            # Entered after the client, so that they are flushed before it is closed.
+            self._indexer = await stack.enter_async_context(BulkIndexer(es, self._index))
+            self._exists = await stack.enter_async_context(ExistsChecker(es, self._index))
+            self._stack = stack.pop_all()
+        return self
+
+    async def __aexit__(self, *args, **kwargs) -> bool | None:
+        assert self._stack is not None
+        ret = await self._stack.__aexit__(*args, **kwargs)
+        self._stack = self._es = self._indexer = self._exists = None
+        return ret
+
+    async def index(self, id_: str, document: dict[str, Any]) -> bool:
+        assert self._indexer is not None
+        return await self._indexer.index(id_, document)
+
+    async def exists(self, id_: str) -> bool:
+        assert self._exists is not None
+        return await self._exists.exists(id_)
+
+    async def count(self) -> int:
+        assert self._es is not None
+        return (await self._es.count(index=self._index))['count']
+
+    async def page_ids(self) -> AsyncIterator[str]:
+        from ..elasticsearch import page_ids
+
+        assert self._es is not None
+        async for id_ in page_ids(self._es, self._index):
+            yield id_
+
+    async def _open_point_in_time(self) -> str:
+        assert self._es is not None
+        with ELASTICSEARCH_SECONDS.labels('open_point_in_time').time():
+            return (await self._es.open_point_in_time(index=self._index, keep_alive=_PIT_KEEP_ALIVE))['id']
+
+    async def _close_point_in_time(self, pit: str) -> None:
+        assert self._es is not None
+        with ELASTICSEARCH_SECONDS.labels('close_point_in_time').time():
+            # It may have expired already.
+            await self._es.options(ignore_status=404).close_point_in_time(id=pit)
+
+    async def _get_highlighter(self) -> str:
+        """The fast vector highlighter, if the index has the term vectors it needs (indexes created by older versions
+        of Memoria don't), or else the unified highlighter."""
+        if self._highlighter is None:
+            assert self._es is not None
+            mappings = await self._es.indices.get_mapping(index=self._index)
+            text = next(iter(mappings.values()))['mappings'].get('properties', {}).get('text', {})
+            if text.get('term_vector') == 'with_positions_offsets':
+                self._highlighter = 'fvh'
+            else:
+                _LOG.warning("The `%s` index has no term vectors with positions, so highlighting search results will "
+                             "be slower. Recreate the index (and reindex) to fix this.", self._index)
+                self._highlighter = 'unified'
+        return self._highlighter
+
+    async def _search(self,
+                      query: str,
+                      size: int,
+                      pit: str | None = None,
+                      after: list[Any] | None = None,
+                      from_: int = 0) -> Any:
+        assert self._es is not None
+        body: dict[str, Any] = {
+            'query': _query(query),
+            'size': size,
+            '_source': {
+                'includes': _SOURCE_FIELDS
+            },
+            # Ties are broken by each hit's place in its shard.
+            'sort': [{
+                '_score': 'desc'
+            }],
+            'track_total_hits': False,
+            # Snippets of the text around the matches, from its term vectors rather than from the text itself (which
+            # is never sent back). HTML in the text is escaped.
+            'highlight': {
+                'type': await self._get_highlighter(),
+                'encoder': 'html',
+                'pre_tags': ['<mark>'],
+                'post_tags': ['</mark>'],
+                'fields': {
+                    'text': {
+                        'fragment_size': SETTINGS.snippet_size,
+                        'number_of_fragments': SETTINGS.snippet_fragments
+                    }
+                }
+            },
+        }
+        if pit is not None:
+            body['pit'] = {'id': pit, 'keep_alive': _PIT_KEEP_ALIVE}
+        if after is not None:
+            body['search_after'] = after
+        elif from_:
+            body['from'] = from_
+        # The score of each named clause comes back with each hit, which is far cheaper than `explain`. The client
+        # doesn't know `include_named_queries_score` (Elasticsearch 8.8+), so the request is made directly.
+        with ELASTICSEARCH_SECONDS.labels('search').time():
+            return await self._es.perform_request('POST',
+                                                  '/_search' if pit is not None else f'/{self._index}/_search',
+                                                  params={'include_named_queries_score': 'true'},
+                                                  headers=_JSON_HEADERS,
+                                                  body=body,
+                                                  endpoint_id='search',
+                                                  path_parts={})
+
+    async def search(self, query: str, size: int, cursor: str | None = None) -> SearchResults:
+        from elasticsearch import NotFoundError
+
+        if not query.split():
+            return SearchResults(results=[])
+
+        pit: str | None = None
+        if cursor is None:
+            # Most searches never get past their first page, so it's searched without a point in time (which costs a
+            # request, and holds a search context on the cluster); an extra hit tells whether there are more.
+            resp = await self._search(query, size + 1)
+        else:
+            state = decode_cursor(query, cursor)
+            pit, after, from_ = state.get('pit'), state.get('after'), state.get('from', 0)
+            if pit is None:
+                valid = after is None and is_number(from_) and isinstance(from_, int) and from_ >= 0
+            else:
+                valid = isinstance(pit, str) and isinstance(after, list) and all(map(is_number, after))
+            if not valid:
+                raise ValueError("Invalid cursor.")
+
+            if pit is None:
+                # Later pages come from a point in time, so that they don't skip or repeat hits as pages are indexed,
+                # and pick up right after the last hit of the previous one. Pages indexed since the first page was
+                # searched can only be skipped or repeated here.
+                pit = await self._open_point_in_time()
+                resp = await self._search(query, size, pit, from_=from_)
+            else:
+                try:
+                    resp = await self._search(query, size, pit, after)
+                except NotFoundError:
+                    # The point in time has expired; carry on from the same place in a new one.
+                    pit = await self._open_point_in_time()
+                    resp = await self._search(query, size, pit, after)
+            # Its ID can change between requests.
+            pit = resp.get('pit_id', pit)
+        if 'hits' not in resp or 'hits' not in resp['hits'] or not isinstance(resp['hits']['hits'], list):
+            if pit is not None:
+                await self._close_point_in_time(pit)
+            return SearchResults(results=[])
+
+        hits = resp['hits']['hits']
+        results = []
+        for hit in hits:
+            source = hit['_source']
+            results.append(
+                Result(
+                    **{
+                        '_id': hit['_id'],
+                        'score': hit['_score'],
+                        'basename': source['basename'] if 'basename' in source else urlparse(source['url']).hostname,
+                        'explanation': hit.get('matched_queries', {}),
+                        'snippet': ' … '.join(hit.get('highlight', {}).get('text', ())) or None,
+                        **source
+                    }))
+        next_cursor = None
+        if pit is None:
+            if len(hits) > size:
+                del results[size:]
+                next_cursor = encode_cursor(query, {'from': size})
+        elif len(hits) == size:
+            next_cursor = encode_cursor(query, {'pit': pit, 'after': hits[-1]['sort']})
+        else:
+            await self._close_point_in_time(pit)
+        return SearchResults(results=results, cursor=next_cursor)
+
+    async def explain(self, id_: str, query: str) -> Explanation:
+        from elasticsearch import NotFoundError
+
+        assert self._es is not None
+        try:
+            with ELASTICSEARCH_SECONDS.labels('explain').time():
+                resp = await self._es.explain(index=self._index, id=id_, query=_query(query))
+        except NotFoundError:
+            raise LookupError("No page with that ID exists.") from None
+        return _explanation(resp['explanation'])
+
+    async def get_preview(self, id_: str) -> str:
+        from elasticsearch import NotFoundError
+
+        assert self._es is not None
+        try:
+            resp = await self._es.get(index=self._index, id=id_, source_includes=('preview',))
+        except NotFoundError:
+            raise LookupError("No page with that ID exists.") from None
+        if not resp.get('found', False):
+            raise LookupError("No page with that ID exists.")
+        return resp['_source'].get('preview', '')
@@ -0,0 +1,287 @@
+import re
+from contextlib import AsyncExitStack
+from hashlib import blake2b
+from html import escape
+from itertools import takewhile
+from logging import getLogger
+from typing import TYPE_CHECKING, Any, AsyncIterator, Self, Sequence
+from urllib.parse import urlparse
+
+from sqlalchemy import and_, column, func, literal_column, or_, select, table, text
+
+from ..batching import Batcher
+from ..model.explanation import Explanation
+from ..model.orm.page import Page
+from ..model.search_result import Result, SearchResults
+from ..settings import SETTINGS
+from . import SearchBackend, decode_cursor, encode_cursor, is_number
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+    from sqlalchemy.sql.elements import ColumnClause
+
+_LOG = getLogger(__spec__.name)
+
+_EXISTS_BATCH_SIZE = 100
+_EXISTS_BATCH_AGE = 0.1
+
+_FTS = table('pages_fts', column('rowid'), column('id'), column('text'), column('rank'))
+"""Full-text index of page text. Pages' other fields are kept in the `pages` table, with the same `id`. Each row's
+`rowid` is derived from its `id` (see `_fts_rowid`), so that a page's text can be replaced without a full scan. `rank`
+is FTS5's BM25 score of a row for the query it was matched by (negated, so that lower is better)."""
+_FTS_TABLE: 'ColumnClause[Any]' = literal_column(_FTS.name)
+"""The full-text index as an argument to FTS5's auxiliary functions (like `bm25` and `snippet`)."""
+_CREATE_FTS = text("CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts "
+                   "USING fts5(id UNINDEXED, text, tokenize='porter unicode61 remove_diacritics 2')")
+
+_PAGE_FIELDS = ('url', 'title', 'timestamp', 'author', 'favicon', 'description', 'preview')
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+_MATCH = re.compile(f'{_MATCH_START}(.*?){_MATCH_END}', re.DOTALL)
+
+
+def _fts_rowid(id_: str) -> int:
+    """A (positive, 63-bit) FTS5 rowid for a page ID."""
+    return int.from_bytes(blake2b(id_.encode(), digest_size=8).digest(), 'big') >> 1
+
+
+def _phrase(word: str) -> str:
+    """Quote a word as an FTS5 phrase, so that FTS5 query syntax (like `AND`, `*` or `column:`) in it isn't
+    interpreted."""
+    return '"{}"'.format(word.replace('"', '""'))
+
+
+def _match_query(query: str) -> str:
+    """Turn a query into an FTS5 query matching pages with any of its words (like Elasticsearch's `match` query)."""
+    return ' OR '.join(_phrase(word) for word in query.split())
+
+
+def _highlight(snippet: str) -> str:
+    """Escape a snippet as HTML, wrapping the matches in it in `<mark>`."""
+    return escape(snippet).replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+
+
+def _fragments(text: str, size: int, count: int) -> list[str]:
+    """Cut text highlighted by FTS5 down to at most `count` fragments of about `size` characters around its matches.
+    Like Elasticsearch's, they're the fragments matching the most distinct words, in the order they appear in the text.
+
+    (FTS5's own `snippet` only makes one, and counts its size in tokens.)"""
+    matches = list(_MATCH.finditer(text))
+    candidates = []
+    for i, match in enumerate(matches):
+        # Start a fragment at a word boundary a little before each match, and end it at one `size` characters later.
+        space = text.find(' ', max(0, match.start() - size // 4), match.start())
+        start = space + 1 if space != -1 else match.start()
+        end = start + size
+        if end < len(text) and (space := text.rfind(' ', match.end(), end)) != -1:
+            end = space
+        covered = list(takewhile(lambda other: other.start() < end, matches[i:]))
+        words = {other.group(1).lower() for other in covered}
+        candidates.append((len(words), len(covered), -start, start, end))
+
+    chosen: list[tuple[int, int]] = []
+    for *_, start, end in sorted(candidates, reverse=True):
+        if len(chosen) == count:
+            break
+        if all(end <= other_start or start >= other_end for other_start, other_end in chosen):
+            chosen.append((start, end))
+
+    fragments = []
+    for start, end in sorted(chosen):
+        fragment = text[start:end].strip()
+        # Don't leave half of a match highlighted.
+        first_start, first_end = fragment.find(_MATCH_START), fragment.find(_MATCH_END)
+        if first_end != -1 and (first_start == -1 or first_end < first_start):
+            fragment = _MATCH_START + fragment
+        if fragment.rfind(_MATCH_START) > fragment.rfind(_MATCH_END):
+            fragment += _MATCH_END
+        fragments.append(fragment)
+    return fragments
+
+
+class _Indexer(Batcher[tuple[str, dict[str, Any]], bool]):
+    """Buffers pages and upserts them with a single statement (per table) per batch."""
+
+    def __init__(self, engine: 'AsyncEngine') -> None:
+        super().__init__(SETTINGS.index_batch_size, SETTINGS.index_batch_age, SETTINGS.index_batch_bytes)
+        self._engine = engine
+
+    async def index(self, id_: str, document: dict[str, Any]) -> bool:
+        return await self.submit((id_, document), size=len(document['text']))
+
+    async def _flush(self, items: list[tuple[str, dict[str, Any]]]) -> Sequence[bool]:
+        from sqlalchemy.dialects.sqlite import insert
+        from sqlalchemy.exc import SQLAlchemyError
+
+        # Only the last document with each ID is kept (like Elasticsearch would).
+        documents = dict(items)
+        stmt = insert(Page).values([{
+            'id': id_,
+            **{field: document.get(field) for field in _PAGE_FIELDS}
+        } for id_, document in documents.items()])
+        rowids = {id_: _fts_rowid(id_) for id_ in documents}
+        try:
+            async with self._engine.begin() as conn:
+                # Pages may be indexed again (when reindexing, or by another process in the meantime).
+                await conn.execute(
+                    stmt.on_conflict_do_update(index_elements=[Page.id],
+                                               set_={field: stmt.excluded[field] for field in _PAGE_FIELDS}))
+                await conn.execute(_FTS.delete().where(_FTS.c.rowid.in_(rowids.values())))
+                await conn.execute(_FTS.insert(), [{
+                    'rowid': rowids[id_],
+                    'id': id_,
+                    'text': document['text']
+                } for id_, document in documents.items()])
+        except SQLAlchemyError:
+            _LOG.exception("Failed to index %d documents:", len(items))
+            return [False] * len(items)
+        return [True] * len(items)
+
+
+class _ExistsChecker(Batcher[str, bool]):
+    """Batches page existence checks into a single query."""
+
+    def __init__(self, engine: 'AsyncEngine') -> None:
+        super().__init__(_EXISTS_BATCH_SIZE, _EXISTS_BATCH_AGE)
+        self._engine = engine
+
+    async def exists(self, id_: str) -> bool:
+        return await self.submit(id_)
+
+    async def _flush(self, items: list[str]) -> Sequence[bool]:
+        async with self._engine.connect() as conn:
+            found = set((await conn.execute(select(Page.id).where(Page.id.in_(set(items))))).scalars())
+        return [id_ in found for id_ in items]
+
+
+class SqliteBackend(SearchBackend):
+    """Indexes pages into an SQLite FTS5 table in the Memoria database (which must be SQLite), and searches it with BM25
+    ranking. Needs no services besides Memoria itself, and little memory."""
+
+    def __init__(self) -> None:
+        self._stack: AsyncExitStack | None = None
+        self._engine: 'AsyncEngine | None' = None
+        self._indexer: _Indexer | None = None
+        self._exists: _ExistsChecker | None = None
+
+    async def __aenter__(self) -> Self:
+        from ..db_clients import create_sql_engine
+        from ..model.orm import create_schema
+
+        engine = create_sql_engine()
+        async with AsyncExitStack() as stack:
+            stack.push_async_callback(engine.dispose)
+            if engine.dialect.name != 'sqlite':
+                raise RuntimeError(f"The `sqlite` search backend requires an SQLite `database_uri`, not "
+                                   f"`{engine.dialect.name}`.")
+            async with engine.begin() as conn:
+                await conn.run_sync(create_schema)
+                await conn.execute(_CREATE_FTS)
+            self._indexer = await stack.enter_async_context(_Indexer(engine))
+            self._exists = await stack.enter_async_context(_ExistsChecker(engine))
+            self._engine = engine
+            self._stack = stack.pop_all()
+        return self
+
+    async def __aexit__(self, *args, **kwargs) -> bool | None:
+        assert self._stack is not None
+        ret = await self._stack.__aexit__(*args, **kwargs)
+        self._stack = self._engine = self._indexer = self._exists = None
+        return ret
+
+    async def index(self, id_: str, document: dict[str, Any]) -> bool:
+        assert self._indexer is not None
+        return await self._indexer.index(id_, document)
+
+    async def exists(self, id_: str) -> bool:
+        assert self._exists is not None
+        return await self._exists.exists(id_)
+
+    async def count(self) -> int:
+        assert self._engine is not None
+        async with self._engine.connect() as conn:
+            return (await conn.execute(select(func.count()).select_from(Page))).scalar_one()
+
+    async def page_ids(self) -> AsyncIterator[str]:
+        assert self._engine is not None
+        async with self._engine.connect() as conn:
+            async for id_ in await conn.stream_scalars(select(Page.id)):
+                yield id_
+
+    async def search(self, query: str, size: int, cursor: str | None = None) -> SearchResults:
+        assert self._engine is not None
+        if not (match := _match_query(query)):
+            return SearchResults(results=[])
+
+        # Pages are ordered by rank, and then rowid (which is unique), so each page of results can pick up after the
+        # last row of the previous one without counting (or ranking again) all the rows before it.
+        ranked = _FTS.alias('ranked')
+        page = (select(ranked.c.rowid).where(ranked.c.text.match(match)).order_by(ranked.c.rank,
+                                                                                   ranked.c.rowid).limit(size))
+        best: float | None = None
+        if cursor is not None:
+            try:
+                state = decode_cursor(query, cursor)
+                (after_rank, after_rowid), best = state['after'], state['best']
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Invalid cursor.") from None
+            if not all(map(is_number, (after_rank, after_rowid, best))):
+                raise ValueError("Invalid cursor.")
+            # Not a row value comparison, which FTS5 gets wrong.
+            page = page.where(
+                or_(ranked.c.rank > after_rank, and_(ranked.c.rank == after_rank, ranked.c.rowid > after_rowid)))
+
+        # Snippets are only made for the rows in this page.
+        highlighted = func.highlight(_FTS_TABLE, 1, _MATCH_START, _MATCH_END).label('highlighted')
+        stmt = (select(Page.id, Page.url, Page.title, Page.timestamp, Page.author, Page.favicon, Page.description,
+                       _FTS.c.rank, _FTS.c.rowid, highlighted).join_from(_FTS, Page, Page.id == _FTS.c.id)
+                .where(_FTS.c.text.match(match), _FTS.c.rowid.in_(page)).order_by(_FTS.c.rank, _FTS.c.rowid))
+        async with self._engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+        if not rows:
+            return SearchResults(results=[])
+
+        # BM25 scores are unbounded; show them relative to the best match (of the first page).
+        if best is None:
+            best = -rows[0].rank
+        results = [
+            Result(_id=row.id,
+                   url=row.url,
+                   title=row.title or row.url,
+                   timestamp=row.timestamp,
+                   author=row.author,
+                   favicon=row.favicon,
+                   description=row.description,
+                   score=-row.rank / best if best > 0 else 0.0,
+                   basename=urlparse(row.url).hostname,
+                   snippet=' … '.join(map(_highlight, _fragments(row.highlighted, SETTINGS.snippet_size,
+                                                                  SETTINGS.snippet_fragments))) or None)
+            for row in rows
+        ]
+        next_cursor = None
+        if len(rows) == size:
+            next_cursor = encode_cursor(query, {'after': [rows[-1].rank, rows[-1].rowid], 'best': best})
+        return SearchResults(results=results, cursor=next_cursor)
+
+    async def explain(self, id_: str, query: str) -> Explanation:
+        assert self._engine is not None
+        # A page's BM25 score is the sum of a score for each of the query's terms, which is its score for that term
+        # alone.
+        score = select(-func.bm25(_FTS_TABLE)).where(_FTS.c.rowid == _fts_rowid(id_))
+        details = []
+        async with self._engine.connect() as conn:
+            if (await conn.execute(select(Page.id).where(Page.id == id_))).one_or_none() is None:
+                raise LookupError("No page with that ID exists.")
+            for word in dict.fromkeys(word.lower() for word in query.split()):
+                value = (await conn.execute(score.where(_FTS.c.text.match(_phrase(word))))).scalar_one_or_none()
+                if value is not None:
+                    details.append(Explanation(value=value, description=f'weight(text:{word}), BM25'))
+        return Explanation(value=sum(detail.value for detail in details), description='sum of:', details=details)
+
+    async def get_preview(self, id_: str) -> str:
+        assert self._engine is not None
+        async with self._engine.connect() as conn:
+            found = (await conn.execute(select(Page.preview).where(Page.id == id_))).one_or_none()
+        if found is None:
+            raise LookupError("No page with that ID exists.")
+        return found.preview or ''
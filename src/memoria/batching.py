@@ -0,0 +1,93 @@
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import AbstractAsyncContextManager
+from typing import Generic, Self, Sequence, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class Batcher(AbstractAsyncContextManager, ABC, Generic[T, R]):
+    """Collects items submitted by concurrent callers and processes them together.
+
+    A batch is flushed once it holds `max_items` items or `max_bytes` bytes, or once its oldest item is `max_age`
+    seconds old. Each caller of `submit` receives the result for its own item. At most `concurrency` flushes run at once
+    or, if a `lock` is given, one at a time across every Batcher given the same `lock`."""
+
+    def __init__(self,
+                 max_items: int,
+                 max_age: float,
+                 max_bytes: int | None = None,
+                 lock: asyncio.Lock | None = None,
+                 concurrency: int = 1) -> None:
+        self._max_items = max(1, max_items)
+        self._max_age = max_age
+        self._max_bytes = max_bytes
+        self._items: list[T] = []
+        self._futures: list[asyncio.Future[R]] = []
+        self._bytes = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushing: set[asyncio.Task[None]] = set()
+        self._lock = lock if lock is not None else asyncio.Semaphore(max(1, concurrency))
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *_, **__) -> bool | None:
+        await self.flush()
+        return None
+
+    async def submit(self, item: T, size: int = 0) -> R:
+        future: asyncio.Future[R] = asyncio.get_running_loop().create_future()
+        self._items.append(item)
+        self._futures.append(future)
+        self._bytes += size
+
+        if len(self._items) >= self._max_items or (self._max_bytes is not None and self._bytes >= self._max_bytes):
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._max_age, self._start_flush)
+
+        return await future
+
+    async def flush(self) -> None:
+        """Flush any pending items and wait for all in-progress flushes to finish."""
+        self._start_flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._items:
+            return
+
+        items, futures = self._items, self._futures
+        self._items, self._futures, self._bytes = [], [], 0
+
+        task = asyncio.create_task(self._run(items, futures))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _run(self, items: list[T], futures: list[asyncio.Future[R]]) -> None:
+        try:
+            async with self._lock:
+                results = await self._flush(items)
+        except asyncio.CancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+        except Exception as ex:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(ex)
+            return
+
+        for future, result in zip(futures, results, strict=True):
+            if not future.done():
+                future.set_result(result)
+
+    @abstractmethod
+    async def _flush(self, items: list[T]) -> Sequence[R]:
+        """Process a batch of items, returning one result per item (in the same order)."""
@@ -7,7 +7,7 @@ from .util import set_context_var
 
 if TYPE_CHECKING:
     from elasticsearch import AsyncElasticsearch
-    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
 async def create_elasticsearch_client(host: str, **kwargs) -> 'AsyncElasticsearch':
     from elasticsearch import AsyncElasticsearch
@@ -20,6 +20,18 @@ async def create_elasticsearch_client(host: str, **kwargs) -> 'AsyncElasticsearc
 
     return es
 
+def create_sql_engine() -> 'AsyncEngine':
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from .metrics import instrument_engine
+    from .model.orm import check_dialect
+
+    engine = create_async_engine(SETTINGS.database_uri, connect_args={"check_same_thread": False})
+    # Rather than partway through the first import.
+    check_dialect(engine.dialect.name)
+    instrument_engine(engine)
+    return engine
+
 _SQL_CLIENT: ContextVar['AsyncSession'] = ContextVar('_SQL_CLIENT')
 
 def get_sql_client() -> 'AsyncSession':
@@ -27,22 +39,20 @@ def get_sql_client() -> 'AsyncSession':
 
 @asynccontextmanager
 async def create_sql_client():
-    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.ext.asyncio import async_sessionmaker
 
-    from .model.orm import CrudBase
+    from .model.orm import create_schema
 
-    global ENGINE
-    global SESSION_MAKER
     if (client := _SQL_CLIENT.get(None)) is not None:
         yield client
         return
+    # Each client gets its own engine: the downloader and a request (like an upload) can hold one at the same time.
+    engine = create_sql_engine()
     try:
-        ENGINE = create_async_engine(SETTINGS.database_uri, connect_args={"check_same_thread": False})
-        SESSION_MAKER = async_sessionmaker(ENGINE, autocommit=False, autoflush=False, expire_on_commit=False)
-        async with ENGINE.begin() as conn:
-            await conn.run_sync(CrudBase.metadata.create_all)
-        async with SESSION_MAKER() as session, set_context_var(_SQL_CLIENT, session):
+        session_maker = async_sessionmaker(engine, autocommit=False, autoflush=False, expire_on_commit=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(create_schema)
+        async with session_maker() as session, set_context_var(_SQL_CLIENT, session):
             yield session
     finally:
-        await ENGINE.dispose()
-        ENGINE = None
+        await engine.dispose()
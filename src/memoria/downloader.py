@@ -2,121 +2,295 @@ import asyncio
 import atexit
 import concurrent.futures
 import multiprocessing as mp
+from contextlib import contextmanager, nullcontext
+from contextvars import Context
+from dataclasses import dataclass
 from datetime import datetime
 from hashlib import sha256
 from logging import Logger, getLogger
 from queue import Empty
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
+from uuid import uuid4
 
 if TYPE_CHECKING:
-    from elasticsearch import AsyncElasticsearch
-    from sqlalchemy.ext.asyncio import AsyncSession
     from threading import Event
     from queue import Queue
 
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from .backends import SearchBackend
+    from .logic.history import HistoryWriter, ValidatorReader
+    from .processing_pool import ProcessingPool
+
+from .archive import Archive
+from .hash_index import HashIndex
+from .logic import crawl_jobs
+from .logic.preview import make_preview
+from .metrics import DOWNLOADS, QUEUE_REMAINING
 from .model.imported_history import ImportedHistory
-from .plugins import ProcessingPluginManager, PluginSuite, Result
+from .plugins._plugin_suite import PluginSuite
+from .plugins._processing_manager import ProcessingPluginManager, Stages
+from .plugins.processing import Result, Validators
+from .scheduler import HostScheduler
+from .search_cache import IndexGeneration, index_generation
 from .settings import SETTINGS
 
 _LOG = getLogger(__spec__.name)
 
-
-async def _create_history_entry(session: 'AsyncSession', history: ImportedHistory, last_scrape: datetime|None) -> None:
-    from .model.orm.history import History as SqlHistory
-    async with session.begin():
-        if (existing := await SqlHistory.find_one(session, SqlHistory.url == history.url)) is not None:
-            if existing.last_visit != history.last_visit:
-                existing.last_visit = history.last_visit
-            if last_scrape is not None:
-                existing.last_scrape = last_scrape
-            await session.commit()
-            return
-        session.add(SqlHistory(last_scrape=last_scrape, **history.model_dump(include={'url', 'title', 'last_visit'})))
-
-
-async def process_one(log: Logger, es: 'AsyncElasticsearch', sql_session: 'AsyncSession', processor: ProcessingPluginManager,
-                      history: ImportedHistory) -> None:
+_QUEUE_POLL_INTERVAL = 0.5
+"""How long (in seconds) a worker waits on the shared queue before re-checking whether it should stop."""
+
+
+@dataclass(slots=True, kw_only=True)
+class WorkerContext:
+    """Per-process resources shared by every in-flight history item."""
+    log: Logger
+    processor: ProcessingPluginManager
+    pool: 'ProcessingPool | None'
+    """Runs filters and the extractor. If not set, `processor` runs them on this event loop."""
+    search: 'SearchBackend'
+    hashes: HashIndex | None
+    """Known content hashes. Only hashes found here need to be checked with `search`."""
+    archive: Archive | None
+    """Where new content is stored (before it's processed), so that it can be reprocessed later."""
+    generation: IndexGeneration
+    """Bumped whenever a page is indexed, so that cached search results are refreshed."""
+    history: 'HistoryWriter'
+    validators: 'ValidatorReader'
+    downloads: asyncio.Semaphore
+    """Acquired before a history item is started, and released by `process_one` once it has been downloaded and
+    processed, or queued for processing by `pool` (so that items waiting on processing or batched writes don't hold up
+    new downloads)."""
+    done: 'Queue[str]'
+    """Receives the URL of each history item once it no longer counts against its host's politeness limits."""
+
+    def downloaded(self, history: ImportedHistory) -> None:
+        self.downloads.release()
+        self.done.put(history.url)
+
+
+def page_document(url: str, title: str | None, timestamp: datetime, result: Result) -> dict[str, Any]:
+    """The document a processed page is indexed as."""
+    assert isinstance(result.content, str)
+    return {
+        'url': url,
+        'timestamp': timestamp,
+        'text': result.content,
+        'title': result.meta.get('title', title),
+        # Extractors may provide their own.
+        'preview': make_preview(result.content, SETTINGS.preview_length),
+        **result.meta
+    }
+
+
+async def _archive(ctx: WorkerContext, content_hash: str, history: ImportedHistory, result: Result) -> None:
+    assert ctx.archive is not None
+    try:
+        await asyncio.to_thread(ctx.archive.put, content_hash, result, history.title, datetime.now())
+    except Exception:
+        # The page can still be indexed, it just can't be reprocessed later.
+        ctx.log.exception("Could not archive the content of `%s`:", history.url)
+
+
+async def process_one(ctx: WorkerContext, history: ImportedHistory) -> None:
+    log = ctx.log
     log.debug('Attempting to download `%s`', history.url)
 
+    try:
+        stored = await ctx.validators.read(history.url)
+    except Exception:
+        # Downloaded unconditionally instead; an exception escaping here would never release the download's slot.
+        log.exception("Could not read the stored cache validators of `%s`:", history.url)
+        stored = None
+
     content_hash: str
     exists_called = False
+    duplicate = False
+    validators: Validators | None = None
 
     async def check_exists(result: Result):
         nonlocal exists_called
         nonlocal content_hash
-        nonlocal history
+        nonlocal duplicate
+        nonlocal validators
         exists_called = True
-        content: bytes
-        if isinstance(result.content, str):
-            content = result.content.encode()
+        validators = result.validators
+        if result.content_hash is not None:
+            content_hash = result.content_hash
+        else:
+            content: bytes
+            if isinstance(result.content, str):
+                content = result.content.encode()
+            else:
+                assert isinstance(result.content, bytes)
+                content = result.content
+            content_hash = sha256(content).hexdigest()
+        if ctx.hashes is not None and content_hash not in ctx.hashes:
+            duplicate = False
         else:
-            assert isinstance(result.content, bytes)
-            content = result.content
-        content_hash = sha256(content).hexdigest()
-        if not await es.exists(index='pages', id=content_hash):
-            return False
-        await _create_history_entry(sql_session, history, datetime.now())
+            duplicate = await ctx.search.exists(content_hash)
+        return duplicate
+
+    async def timed_check_exists(result: Result) -> bool:
+        with ctx.processor.timed('check_exists', 'check_exists', history.url, result):
+            return await check_exists(result)
+
+    released = False
+
+    def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            ctx.downloaded(history)
+
+    try:
+        result = await ctx.processor.download(history, stored)
+        if result is not None and result.retry_after is not None:
+            # Back in the queue before this item counts as done, so that the download doesn't finish without it.
+            await ctx.history.defer(history, result.retry_after)
+        elif result is not None and not result.not_modified and not await timed_check_exists(result):
+            if ctx.archive is not None:
+                await _archive(ctx, content_hash, history, result)
+            if ctx.pool is not None:
+                result = await ctx.pool.process(result, queued=release)
+            else:
+                result = await ctx.processor.process(result)
+    finally:
+        release()
+
+    if result is not None and result.retry_after is not None:
+        log.debug("`%s` will be downloaded again later.", history.url)
+        DOWNLOADS.labels('deferred').inc()
+        return
+
+    if result is not None and result.not_modified:
+        log.debug("`%s` has not changed since it was last downloaded. Continuing.", history.url)
+        DOWNLOADS.labels('not_modified').inc()
+        await ctx.history.write(history, datetime.now(), result.validators or stored)
+        return
+
+    if duplicate:
         log.debug("The content of `%s` has been downloaded before. Continuing.", history.url)
-        return True
+        DOWNLOADS.labels('duplicate').inc()
+        await ctx.history.write(history, datetime.now(), validators)
+        return
 
-    result = await processor.process_one(history, check_exists)
     if result is None:
         if not exists_called:
             log.warning("The content of `%s` could not be downloaded.", history.url)
-            await _create_history_entry(sql_session, history, None)
+            DOWNLOADS.labels('download_failed').inc()
+        else:
+            log.warning("The content of `%s` could not be processed.", history.url)
+            DOWNLOADS.labels('processing_failed').inc()
+        await ctx.history.write(history, None)
         return
 
-    assert isinstance(result.content, str)
-
-    await es.index(
-        index='pages',
-        id=content_hash,
-        document={
-            'url': history.url,
-            'timestamp': datetime.now(),
-            'text': result.content,
-            'title': result.meta.get('title', history.title),
-            # 'preview': ...
-            **result.meta
-        })
+    indexed = await ctx.search.index(content_hash, page_document(history.url, history.title, datetime.now(), result))
+    if not indexed:
+        log.warning("The content of `%s` could not be archived.", history.url)
+        DOWNLOADS.labels('index_failed').inc()
+        await ctx.history.write(history, None)
+        return
 
+    if ctx.hashes is not None:
+        ctx.hashes.add(content_hash)
+    ctx.generation.bump()
     log.info("`%s` has been archived.", history.url)
-    await _create_history_entry(sql_session, history, datetime.now())
-
-
-async def worker(log: Logger, queue: 'Queue[ImportedHistory]', no_more: 'Event', canceled: 'Event') -> None:
-    from .db_clients import create_elasticsearch_client, create_sql_client
-    processor = PluginSuite().create_processing_manager()
-    es = await create_elasticsearch_client(SETTINGS.elastic_host,
-                                           basic_auth=(SETTINGS.elastic_user, SETTINGS.elastic_password))
-    async with create_sql_client() as sql_session, es, processor:
-        while not canceled.is_set():
+    DOWNLOADS.labels('indexed').inc()
+    await ctx.history.write(history, datetime.now(), validators)
+
+
+async def worker(log: Logger, queue: 'Queue[ImportedHistory]', done: 'Queue[str]', no_more: 'Event',
+                 canceled: 'Event', hash_index: HashIndex | None, generation: IndexGeneration,
+                 processing_workers: int) -> None:
+    from .backends import create_search_backend
+    from .db_clients import create_sql_client
+    from .logic.history import HistoryWriter, ValidatorReader
+    from .processing_pool import ProcessingPool
+
+    pool: ProcessingPool | None = None
+    if processing_workers > 0:
+        processor = PluginSuite().create_processing_manager(Stages.DOWNLOAD)
+        pool = ProcessingPool(processing_workers, backlog=2 * processing_workers, batch_size=processor.batch_size,
+                              batch_age=processor.batch_age)
+    else:
+        processor = PluginSuite().create_processing_manager()
+    sql_lock = asyncio.Lock()
+    async with (create_sql_client() as sql_session, create_search_backend() as search, processor,
+                HistoryWriter(sql_session, sql_lock) as history_writer,
+                ValidatorReader(sql_session, sql_lock) as validators, pool or nullcontext()):
+        downloads = asyncio.Semaphore(max(1, SETTINGS.import_concurrency))
+        ctx = WorkerContext(log=log,
+                            processor=processor,
+                            pool=pool,
+                            search=search,
+                            hashes=hash_index,
+                            archive=Archive(SETTINGS.archive_dir) if SETTINGS.archive else None,
+                            generation=generation,
+                            history=history_writer,
+                            validators=validators,
+                            downloads=downloads,
+                            done=done)
+        stopping = asyncio.Event()
+        in_flight: set[asyncio.Task[None]] = set()
+
+        async def run_one(history: ImportedHistory) -> None:
             try:
-                await process_one(log, es, sql_session, processor, queue.get(block=not no_more.is_set()))
-            except Empty:
-                if no_more.is_set():
-                    return
-                if canceled.is_set():
-                    log.critical("Canceled!")
-                    return
-            except (asyncio.CancelledError, KeyboardInterrupt, GeneratorExit):
-                log.critical("Canceled!")
-                return
-            except RuntimeError as ex:
-                if ex.args[0] == "Event loop is closed":
-                    log.critical("Event loop closed!")
-                    return
-                log.exception("Unhandled critical exception whille processing history item, cannot continue:")
-                return
+                await process_one(ctx, history)
             except Exception:
                 log.exception("Unhanded exception while processing history item:")
-            except BaseException:
-                log.exception("Unhandled critical exception whille processing history item, cannot continue:")
+
+        async def watch_canceled() -> None:
+            while not canceled.is_set():
+                await asyncio.sleep(_QUEUE_POLL_INTERVAL)
+            log.critical("Canceled!")
+            stopping.set()
+            for task in in_flight:
+                task.cancel()
+
+        try:
+            async with asyncio.TaskGroup() as tasks:
+                watcher = tasks.create_task(watch_canceled())
+                while not stopping.is_set():
+                    await downloads.acquire()
+                    if stopping.is_set():
+                        downloads.release()
+                        break
+                    try:
+                        history = await asyncio.to_thread(queue.get, timeout=_QUEUE_POLL_INTERVAL)
+                    except Empty:
+                        downloads.release()
+                        if no_more.is_set():
+                            break
+                        continue
+                    except Exception:
+                        downloads.release()
+                        log.exception("Unhandled critical exception while reading from the queue, cannot continue:")
+                        break
+                    if stopping.is_set():
+                        downloads.release()
+                        break
+
+                    in_flight.add(task := tasks.create_task(run_one(history)))
+                    task.add_done_callback(in_flight.discard)
+                watcher.cancel()
+        except (asyncio.CancelledError, KeyboardInterrupt, GeneratorExit):
+            log.critical("Canceled!")
+        except RuntimeError as ex:
+            if ex.args and ex.args[0] == "Event loop is closed":
+                log.critical("Event loop closed!")
                 return
+            log.exception("Unhandled critical exception whille processing history item, cannot continue:")
 
 
-def worker_main(log: int, queue: 'Queue[ImportedHistory]', no_more: 'Event', canceled: 'Event') -> None:
-    asyncio.new_event_loop().run_until_complete(worker(getLogger(__spec__.name + f"<{log}>"), queue, no_more, canceled))
+def worker_main(log: int, queue: 'Queue[ImportedHistory]', done: 'Queue[str]', no_more: 'Event', canceled: 'Event',
+                hashes: str | None, generation: str, processing_workers: int) -> None:
+    with (HashIndex.attach(hashes) if hashes is not None else nullcontext() as hash_index,
+          IndexGeneration.attach(generation) as index_gen):
+        # Run in a fresh context: forked workers would otherwise inherit the parent's SQL client context variable.
+        Context().run(asyncio.new_event_loop().run_until_complete,
+                      worker(getLogger(__spec__.name + f"<{log}>"), queue, done, no_more, canceled, hash_index,
+                             index_gen, processing_workers))
 
 
 def _worker_done(future: asyncio.Future[None]) -> None:
@@ -130,29 +304,80 @@ def _setup_logging() -> None:
     from . import MODULE_LOGGER
     from .util import ColorFormatter
     logger = MODULE_LOGGER
-    logger.level = logging.DEBUG
+    logger.setLevel(SETTINGS.log_level.upper())
     handler = logging.StreamHandler()
     handler.setLevel(logger.level)
     handler.setFormatter(ColorFormatter())
     logger.addHandler(handler)
 
-async def do_download(todo: list[ImportedHistory]) -> None:
-    num_workers = max(1, min(len(todo) // 2, SETTINGS.import_threads))
-    _LOG.info(f'Downloading {len(todo):,} URLs across {num_workers} workers...')
+async def _load_hash_index(extra: int) -> HashIndex | None:
+    """Create a `HashIndex` holding the ID of every indexed page, with room for `extra` more (or more than that: an
+    index over capacity flags nearly every page as a possible duplicate)."""
+    from .backends import create_search_backend
+
+    try:
+        async with create_search_backend() as search:
+            count = await search.count()
+            # Jobs may still be being added, so `extra` can be far too few.
+            extra = max(extra, count, SETTINGS.hash_index_capacity)
+            hashes = HashIndex.create(count + extra, SETTINGS.hash_index_error_rate)
+            try:
+                async for id_ in search.page_ids():
+                    hashes.add(id_)
+            except BaseException:
+                hashes.close()
+                raise
+    except Exception:
+        _LOG.exception("Could not load known page hashes, every page will be checked with the search backend:")
+        return None
+    _LOG.debug("Loaded %d known page hashes.", count)
+    return hashes
+
+
+async def do_download() -> None:
+    """Download and index pending crawl jobs until there are none left."""
+    from .db_clients import create_sql_client
+
+    async with create_sql_client() as session:
+        await _download_jobs(session)
+
+
+async def _download_jobs(session: 'AsyncSession') -> None:
+    owner = uuid4().hex
+    total = await crawl_jobs.unfinished(session)
+    if not total:
+        _LOG.info("There are no pending crawl jobs.")
+        return
+
+    concurrency = max(1, SETTINGS.import_concurrency)
+    num_workers = max(1, min(-(total // -concurrency), SETTINGS.import_threads))
+    if _FEEDERS:
+        # More jobs are still being added, so `total` says little about how many there will be.
+        num_workers = max(1, SETTINGS.import_threads)
+    _LOG.info(f'Downloading {total:,} URLs across {num_workers} workers ({concurrency} concurrent each)...')
+
+    # Split the processing workers between the download workers.
+    processing_workers = 0
+    if SETTINGS.processing_workers > 0:
+        processing_workers = max(1, round(SETTINGS.processing_workers / num_workers))
 
     context = mp.get_context()
-    total = len(todo)
 
-    with mp.Manager() as manager, concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_setup_logging) as pool:
+    hashes = await _load_hash_index(total) if SETTINGS.hash_index else None
+
+    with hashes or nullcontext(), mp.Manager() as manager, concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_setup_logging) as pool:
         queue: 'Queue[ImportedHistory]' = manager.Queue()
+        done: 'Queue[str]' = manager.Queue()
         no_more = manager.Event()
         canceled = manager.Event()
 
         loop = asyncio.get_running_loop()
         _LOG.debug("Creating executors.")
         futures = [
-            loop.run_in_executor(pool, worker_main, i+1, queue, no_more, canceled)
-            for i in range(min(SETTINGS.import_threads, len(todo)))
+            loop.run_in_executor(pool, worker_main, i+1, queue, done, no_more, canceled,
+                                 hashes.name if hashes is not None else None, index_generation().name,
+                                 processing_workers)
+            for i in range(num_workers)
         ]
         for f in futures:
             f.add_done_callback(_worker_done)
@@ -192,20 +417,143 @@ async def do_download(todo: list[ImportedHistory]) -> None:
                 _LOG.warning("Worker process failed to exit in a timely fashion! Killing...")
                 p.kill()
 
-        for t in todo:
-            queue.put(t)
-        no_more.set()
-
-        _LOG.debug("Queue filled. Waiting for executors to finish.")
+        scheduler: HostScheduler[ImportedHistory] = HostScheduler(SETTINGS.host_concurrency, SETTINGS.host_delay)
+        capacity = num_workers * concurrency
+        exhausted = False
+        finished = 0
+
+        async def claim() -> None:
+            """Claim more jobs once the scheduler runs low."""
+            nonlocal exhausted
+            if exhausted:
+                # Jobs still in flight may yet be deferred, so once they're done, check for any that were.
+                if scheduler.pending or scheduler.in_flight or not await crawl_jobs.deferred(session):
+                    return
+            elif scheduler.pending >= capacity:
+                return
+            todo = await crawl_jobs.claim(session, owner, 2 * capacity)
+            for t in todo:
+                scheduler.add(t.url, t)
+            # While jobs are still being added, or some have been deferred until later, having none to claim right now
+            # doesn't mean we're done.
+            exhausted = not todo and not _FEEDERS and not await crawl_jobs.deferred(session)
+
+        def dispatch() -> None:
+            now = loop.time()
+            while scheduler.in_flight < capacity and (item := scheduler.next(now)) is not None:
+                queue.put(item)
+            if exhausted and not scheduler.pending and not scheduler.in_flight and not no_more.is_set():
+                no_more.set()
+                _LOG.debug("All items dispatched. Waiting for executors to finish.")
+
+        async def wait_for_done() -> None:
+            nonlocal finished
+            timeout = 1.0
+            if scheduler.in_flight < capacity and (wait := scheduler.wait_time(loop.time())) is not None:
+                timeout = min(timeout, max(0.01, wait))
+            try:
+                scheduler.done(await asyncio.to_thread(done.get, timeout=timeout))
+                finished += 1
+                while True:
+                    scheduler.done(done.get_nowait())
+                    finished += 1
+            except Empty:
+                pass
 
         try:
             last = total
+            last_report = last_renew = loop.time()
             while futures:
-                _, futures = await asyncio.wait(futures, timeout=1)
-
-                size = queue.qsize()
-                if size != last:
+                await claim()
+                dispatch()
+                await wait_for_done()
+                _, futures = await asyncio.wait(futures, timeout=0)
+
+                if loop.time() - last_renew >= SETTINGS.crawl_lease / 3:
+                    last_renew = loop.time()
+                    await crawl_jobs.renew(session, owner)
+
+                size = max(total - finished, scheduler.pending + scheduler.in_flight)
+                total = max(total, finished + size)
+                QUEUE_REMAINING.set(size)
+                if size != last and loop.time() - last_report >= 1:
                     last = size
+                    last_report = loop.time()
                     _LOG.info("Queue has %d of %d (%.02f%%) items remaining", size, total, size / total * 100)
         except asyncio.CancelledError:
             await stop_all()
+            await crawl_jobs.release(session, owner)
+            raise
+        finally:
+            atexit.unregister(kill_mp_children)
+            QUEUE_REMAINING.set(0)
+
+
+_DOWNLOADER: asyncio.Task[None] | None = None
+_RERUN = False
+_FEEDERS = 0
+"""The number of imports still adding crawl jobs."""
+
+
+@contextmanager
+def feeding():
+    """Keeps a running download claiming new crawl jobs (rather than finishing once it runs out) until exited."""
+    global _FEEDERS
+    _FEEDERS += 1
+    try:
+        yield
+    finally:
+        _FEEDERS -= 1
+
+
+async def release_abandoned() -> None:
+    """Return every in-progress crawl job to the queue. Only call this before starting to download: with one download
+    per server, jobs still in progress then were left by one that didn't stop cleanly (rather than waiting for their
+    leases to expire)."""
+    from .db_clients import create_sql_client
+
+    async with create_sql_client() as session:
+        await crawl_jobs.release(session)
+
+
+def run_downloader() -> None:
+    """Start downloading pending crawl jobs in the background. If a download is already running it may have stopped
+    claiming new jobs, so it is run again once it finishes."""
+    global _DOWNLOADER
+    global _RERUN
+    if _DOWNLOADER is not None and not _DOWNLOADER.done():
+        _RERUN = True
+        return
+    _RERUN = False
+    # In a fresh context, so that it doesn't pick up the caller's SQL client.
+    _DOWNLOADER = asyncio.create_task(do_download(), context=Context())
+    _DOWNLOADER.add_done_callback(_downloader_done)
+
+
+def _downloader_done(task: asyncio.Task[None]) -> None:
+    if task.cancelled():
+        return
+    if (ex := task.exception()) is not None:
+        _LOG.error("Downloader raised exception: %s", str(ex), exc_info=ex)
+    if _RERUN:
+        run_downloader()
+
+
+async def wait_for_downloader() -> None:
+    """Wait until the background download (and any re-runs of it) has finished."""
+    while _DOWNLOADER is not None and not _DOWNLOADER.done():
+        # `_downloader_done` runs before this wakes up, so a re-run has already replaced `_DOWNLOADER`.
+        await asyncio.wait([_DOWNLOADER])
+
+
+async def stop_downloader() -> None:
+    """Cancel the background download, if any. Its unfinished jobs are resumed by the next one."""
+    global _RERUN
+    _RERUN = False
+    if _DOWNLOADER is None or _DOWNLOADER.done():
+        return
+    _DOWNLOADER.cancel()
+    try:
+        await _DOWNLOADER
+    except asyncio.CancelledError:
+        pass
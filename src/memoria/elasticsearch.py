@@ -1,11 +1,18 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, AsyncIterator, Sequence
 from logging import getLogger
 
+from .batching import Batcher
+from .metrics import ELASTICSEARCH_SECONDS
+from .settings import SETTINGS
+
 if TYPE_CHECKING:
     from elasticsearch import AsyncElasticsearch
 
 _LOG = getLogger(__spec__.name)
 
+_EXISTS_BATCH_SIZE = 100
+_EXISTS_BATCH_AGE = 0.1
+
 PAGES_INDEX_KWARGS = {
     'settings': {
         'similarity': {
@@ -41,7 +48,8 @@ PAGES_INDEX_KWARGS = {
             "text": {
                 "type": "text",
                 "similarity": "scripted_tfidf",
-                'term_vector': 'with_offsets',
+                # Needed by the fast vector highlighter.
+                'term_vector': 'with_positions_offsets',
                 'store': True,
                 'analyzer': 'my_english_analyzer'
             },
@@ -64,3 +72,72 @@ async def check_es_indexes(es: 'AsyncElasticsearch') -> None:
     if not await es.indices.exists(index='pages'):
         _LOG.info('Creating `pages` index...')
         await es.indices.create(index='pages', **PAGES_INDEX_KWARGS)
+
+
+async def page_ids(es: 'AsyncElasticsearch', index: str = 'pages') -> AsyncIterator[str]:
+    """Iterate over the IDs (content hashes) of every indexed page."""
+    from elasticsearch.helpers import async_scan
+
+    async for hit in async_scan(es, index=index, query={'query': {'match_all': {}}}, _source=False, size=5_000):
+        yield hit['_id']
+
+
+def _document_size(document: dict[str, Any]) -> int:
+    return sum(len(value) for value in document.values() if isinstance(value, str))
+
+
+class BulkIndexer(Batcher[tuple[str, dict[str, Any]], bool]):
+    """Buffers documents and indexes them through the `_bulk` API."""
+
+    def __init__(self, es: 'AsyncElasticsearch', index: str = 'pages') -> None:
+        super().__init__(SETTINGS.index_batch_size, SETTINGS.index_batch_age, SETTINGS.index_batch_bytes)
+        self._es = es
+        self._index = index
+
+    async def index(self, id_: str, document: dict[str, Any]) -> bool:
+        """Index `document`, returning whether it was indexed successfully."""
+        return await self.submit((id_, document), size=_document_size(document))
+
+    async def _flush(self, items: list[tuple[str, dict[str, Any]]]) -> Sequence[bool]:
+        from elasticsearch import ApiError, TransportError
+
+        operations: list[dict[str, Any]] = []
+        for id_, document in items:
+            operations.append({'index': {'_index': self._index, '_id': id_}})
+            operations.append(document)
+
+        _LOG.debug("Bulk indexing %d documents into `%s`.", len(items), self._index)
+        try:
+            with ELASTICSEARCH_SECONDS.labels('bulk').time():
+                resp = await self._es.bulk(operations=operations)
+        except (ApiError, TransportError):
+            _LOG.exception("Failed to bulk index %d documents:", len(items))
+            return [False] * len(items)
+
+        results: list[bool] = []
+        for (id_, _), item in zip(items, resp['items']):
+            if (error := item['index'].get('error')) is not None:
+                reason = error.get('reason', error) if isinstance(error, dict) else error
+                _LOG.warning("Failed to index document `%s`: %s", id_, reason)
+                results.append(False)
+            else:
+                results.append(True)
+        return results
+
+
+class ExistsChecker(Batcher[str, bool]):
+    """Batches document existence checks through the `_mget` API."""
+
+    def __init__(self, es: 'AsyncElasticsearch', index: str = 'pages') -> None:
+        super().__init__(_EXISTS_BATCH_SIZE, _EXISTS_BATCH_AGE)
+        self._es = es
+        self._index = index
+
+    async def exists(self, id_: str) -> bool:
+        return await self.submit(id_)
+
+    async def _flush(self, items: list[str]) -> Sequence[bool]:
+        with ELASTICSEARCH_SECONDS.labels('mget').time():
+            resp = await self._es.mget(index=self._index, ids=list(set(items)), source=False)
+        found = {doc['_id'] for doc in resp['docs'] if doc.get('found', False)}
+        return [id_ in found for id_ in items]
@@ -0,0 +1,73 @@
+import math
+import struct
+from contextlib import AbstractContextManager
+from hashlib import blake2b
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterator, Self
+
+from .util import attach_shared_memory
+
+_HEADER = struct.Struct('<QQ')
+"""The number of bits and the number of hash functions, stored at the start of the shared memory block."""
+
+
+class HashIndex(AbstractContextManager):
+    """A Bloom filter of content hashes, kept in shared memory so that every import process can use (and add to) the
+    same one.
+
+    A hash that is not `in` the index has definitely not been indexed before. A hash that is may have been, and should be
+    confirmed with Elasticsearch. Processes adding the same byte at the same moment can lose a bit, which only means a
+    duplicate page is indexed (under the same ID) again."""
+
+    def __init__(self, shm: SharedMemory, owner: bool) -> None:
+        self._shm = shm
+        self._owner = owner
+        assert shm.buf is not None
+        self._bits, self._hashes = _HEADER.unpack_from(shm.buf)
+        self._buf = shm.buf[_HEADER.size:]
+
+    @classmethod
+    def create(cls, capacity: int, error_rate: float) -> Self:
+        """Create a new, empty index sized to hold `capacity` hashes with the given false-positive rate."""
+        capacity = max(1, capacity)
+        bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2)**2))
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        shm = SharedMemory(create=True, size=_HEADER.size + -(bits // -8))
+        assert shm.buf is not None
+        _HEADER.pack_into(shm.buf, 0, bits, hashes)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> Self:
+        """Attach to an index created (by `create`) in another process."""
+        return cls(attach_shared_memory(name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def __exit__(self, *_, **__) -> bool | None:
+        self.close()
+        return None
+
+    def close(self) -> None:
+        self._buf.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def _positions(self, id_: str) -> Iterator[int]:
+        digest = blake2b(id_.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self._bits for i in range(self._hashes))
+
+    def add(self, id_: str) -> None:
+        buf = self._buf
+        for pos in self._positions(id_):
+            buf[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, id_: str) -> bool:
+        buf = self._buf
+        return all(buf[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(id_))
+
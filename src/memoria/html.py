@@ -1,36 +1,215 @@
+from abc import ABC, abstractmethod
+from copy import deepcopy
+from dataclasses import dataclass
+from functools import cache
 from logging import getLogger
-from functools import reduce
-import re
+from typing import TYPE_CHECKING, ClassVar, Generic, Iterable, Mapping, TypeVar
+from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup, Comment
+from .settings import SETTINGS
+
+if TYPE_CHECKING:
+    from bs4 import Tag
+    from selectolax.lexbor import LexborNode
 
 _LOG = getLogger(__spec__.name)
 
-def _find_one_of(soup: BeautifulSoup, element: str) -> BeautifulSoup:
-    _LOG.debug('looking for %s', element)
-    res: list[BeautifulSoup]
-    if (res := soup.find_all(element, limit=2)) and len(res) == 1:
-        _LOG.debug("Found a singular <%s> element. Scoping.", element)
-        return res[0]
-    return soup
+N = TypeVar('N')
+
+HTML_TREE = 'application/x-memoria-html-tree'
+"""Content-Type of a parsed `HtmlTree`, which may come from any parser backend."""
+
+BOILERPLATE = ('a[role=button]', 'form', 'input', 'nav', '.noprint', 'header', 'script', 'style')
+"""Elements removed by `clean_html`."""
+
+SCOPES = ('main', 'article', '[id="content" i]')
+"""Elements `clean_html` narrows the document down to, in order, if there's exactly one of them."""
+
+ALLOWED_META = ('author', 'description')
+"""The `<meta name=...>` values kept by `extract_meta`."""
+
+
+class HtmlBackend(ABC, Generic[N]):
+    """Wraps an HTML parser, providing the handful of tree operations needed to clean documents and extract their text
+    and metadata."""
+    name: ClassVar[str]
+
+    @abstractmethod
+    def parse(self, content: str | bytes, encoding: str | None) -> N:
+        """Parse a document, returning its root node."""
+
+    @abstractmethod
+    def copy(self, node: N) -> N:
+        ...
+
+    @abstractmethod
+    def select(self, node: N, selector: str, limit: int | None = None) -> list[N]:
+        """Find the descendants of `node` matching a CSS selector, in document order."""
+
+    @abstractmethod
+    def remove(self, nodes: list[N]) -> None:
+        """Remove nodes (which may be nested within one another) from their tree."""
+
+    def remove_comments(self, node: N) -> None:
+        """Remove comments. They are never part of the text, so by default they are left alone."""
+
+    @abstractmethod
+    def attributes(self, node: N) -> Mapping[str, str | None]:
+        ...
+
+    @abstractmethod
+    def text(self, node: N) -> str:
+        """The text content of `node`, with whitespace collapsed."""
+
+
+class SoupBackend(HtmlBackend['Tag']):
+    """BeautifulSoup, with either its built-in `html.parser` tree builder or `lxml`'s."""
+
+    def __init__(self, features: str) -> None:
+        if features == 'lxml':
+            try:
+                import lxml
+            except ImportError as ex:
+                raise ImportError("The `lxml` HTML parser requires `lxml` to be installed.") from ex
+        self.name = features  # type: ignore[misc]
+        self._features = features
+
+    def parse(self, content: str | bytes, encoding: str | None) -> 'Tag':
+        from bs4 import BeautifulSoup
+        if isinstance(content, str):
+            encoding = None
+        return BeautifulSoup(content, from_encoding=encoding, features=self._features)
+
+    def copy(self, node: 'Tag') -> 'Tag':
+        return deepcopy(node)
+
+    def select(self, node: 'Tag', selector: str, limit: int | None = None) -> list['Tag']:
+        return node.select(selector, limit=limit)
+
+    def remove(self, nodes: list['Tag']) -> None:
+        for node in nodes:
+            node.extract()
+
+    def remove_comments(self, node: 'Tag') -> None:
+        from bs4 import Comment
+        for comment in node.find_all(string=lambda text: isinstance(text, Comment)):
+            comment.extract()
+
+    def attributes(self, node: 'Tag') -> Mapping[str, str | None]:
+        # Multi-valued attributes (like `class` and `rel`) are parsed into lists.
+        return {k: ' '.join(v) if isinstance(v, list) else v for k, v in node.attrs.items()}
 
-def clean_html(soup: BeautifulSoup) -> BeautifulSoup:
+    def text(self, node: 'Tag') -> str:
+        return node.get_text(separator=' ', strip=True)
+
+
+class LexborBackend(HtmlBackend['LexborNode']):
+    """selectolax, using the Lexbor HTML engine."""
+    name = 'selectolax'
+
+    def __init__(self) -> None:
+        try:
+            from selectolax.lexbor import LexborHTMLParser
+        except ImportError as ex:
+            raise ImportError("The `selectolax` HTML parser requires `selectolax` to be installed.") from ex
+        self._parser = LexborHTMLParser
+
+    def parse(self, content: str | bytes, encoding: str | None) -> 'LexborNode':
+        if isinstance(content, str):
+            return self._root(content)
+
+        from bs4 import UnicodeDammit
+
+        # Lexbor only parses text, so it's decoded like BeautifulSoup decodes it: with the given encoding if it's valid,
+        # or else the one declared in the document (or failing that, guessed).
+        dammit = UnicodeDammit(content, known_definite_encodings=[encoding] if encoding else [], is_html=True)
+        if dammit.unicode_markup is not None:
+            return self._root(dammit.unicode_markup)
+        return self._root(content.decode('utf-8', errors='replace'))
+
+    def copy(self, node: 'LexborNode') -> 'LexborNode':
+        return self._root(node.html or '')
+
+    def _root(self, content: str) -> 'LexborNode':
+        # Lexbor always builds at least `<html><head></head><body></body></html>`, so this is only `None` if it failed.
+        if (root := self._parser(content).root) is None:
+            raise ValueError("Lexbor could not parse the document.")
+        return root
+
+    def select(self, node: 'LexborNode', selector: str, limit: int | None = None) -> list['LexborNode']:
+        found = node.css(selector)
+        return found[:limit] if limit is not None else found
+
+    def remove(self, nodes: list['LexborNode']) -> None:
+        # Destroying a node also destroys its descendants, so only destroy the outermost ones.
+        ids = {node.mem_id for node in nodes}
+        for node in nodes:
+            parent = node.parent
+            while parent is not None and parent.mem_id not in ids:
+                parent = parent.parent
+            if parent is None:
+                node.decompose()
+
+    def attributes(self, node: 'LexborNode') -> Mapping[str, str | None]:
+        return node.attributes
+
+    def text(self, node: 'LexborNode') -> str:
+        # Lexbor joins whitespace-only text nodes too, leaving runs of separators behind.
+        return ' '.join(node.text(separator=' ', strip=True).split())
+
+
+_BACKENDS = {
+    'html.parser': lambda: SoupBackend('html.parser'),
+    'lxml': lambda: SoupBackend('lxml'),
+    'selectolax': LexborBackend,
+}
+
+
+@cache
+def get_backend(name: str | None = None) -> HtmlBackend:
+    """Get an HTML parser backend by name (by default, the configured `html_parser`)."""
+    name = name if name is not None else SETTINGS.html_parser
+    if (factory := _BACKENDS.get(name)) is None:
+        raise ValueError(f"Unknown HTML parser `{name}`, expected one of: `{'`, `'.join(_BACKENDS)}`.")
+    return factory()
+
+
+@dataclass(slots=True)
+class HtmlTree(Generic[N]):
+    """A node of a parsed document, along with the backend that parsed it, and (if it was captured before the document
+    was cleaned) the document's metadata as returned by `extract_meta`."""
+    backend: HtmlBackend[N]
+    node: N
+    head: dict[str, str] | None = None
+
+
+def clean_html(backend: HtmlBackend[N], root: N) -> N:
+    """Remove boilerplate from a document (in place), and return the node most likely to hold its main content."""
     _LOG.debug('cleaning HTML')
-    soup = soup.__copy__()
-    [comment.extract() for comment in soup.findAll(string=lambda text: isinstance(text, Comment))]
-    [button.extract() for button in soup.find_all('a', {'role': 'button'})]
-    [match.extract() for match in soup.find_all({'form', 'input', 'nav'})]
-    [match.extract() for match in soup.find_all(class_='noprint')]
+    backend.remove_comments(root)
+    backend.remove(backend.select(root, ', '.join(BOILERPLATE)))
+
+    ret = root
+    for selector in SCOPES:
+        if len(found := backend.select(ret, selector, limit=2)) == 1:
+            _LOG.debug("Found a singular `%s` element. Scoping.", selector)
+            ret = found[0]
+    return ret
 
-    for header in soup(['header', 'script', 'style']):
-        header.decompose()
 
-    ret = soup
-    for element in ('main', 'article'):
-        ret = _find_one_of(ret, element)
+def extract_meta(backend: HtmlBackend[N], root: N, url: str, allowed: Iterable[str] = ALLOWED_META) -> dict[str, str]:
+    """Extract the allowed `<meta>` values, the title, and the favicon URL of a document. This must happen before the
+    document is cleaned, which may remove or scope away its `<head>`."""
+    allowed = set(allowed)
+    ret: dict[str, str] = {}
+    for meta in backend.select(root, 'meta[name][content]'):
+        attrs = backend.attributes(meta)
+        if attrs['name'] in allowed and (content := attrs['content']) is not None:
+            ret[attrs['name']] = content
 
-    if (id_elem := ret.find_all(attrs={'id': re.compile('^content$', re.I)}, limit=2)) and len(id_elem) == 1:
-        _LOG.debug("Found a <... id='content'> element. Scoping.")
-        soup = id_elem[0]
+    if title := backend.select(root, 'title', limit=1):
+        ret['title'] = backend.text(title[0])
 
+    if icon := backend.select(root, 'link[rel~=icon][href]', limit=1):
+        ret['favicon'] = urljoin(url, backend.attributes(icon[0])['href'])
     return ret
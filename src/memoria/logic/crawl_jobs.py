@@ -0,0 +1,76 @@
+import asyncio
+from datetime import timedelta
+from itertools import batched
+from typing import TYPE_CHECKING, Callable, Iterable
+
+from ..model.imported_history import ImportedHistory
+from ..model.orm.crawl_job import CrawlJob, JobState
+from ..settings import SETTINGS
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+_ENQUEUE_BATCH_SIZE = 500
+
+
+def _lease() -> timedelta:
+    return timedelta(seconds=SETTINGS.crawl_lease)
+
+
+async def enqueue(session: 'AsyncSession', visits: Iterable[ImportedHistory]) -> None:
+    """Add history items to the crawl job queue and commit them."""
+    for chunk in batched(visits, _ENQUEUE_BATCH_SIZE):
+        await CrawlJob.enqueue_many(session, [{
+            'url': visit.url,
+            'title': visit.title,
+            'last_visit': visit.last_visit
+        } for visit in chunk])
+    await session.commit()
+
+
+async def enqueue_from(session: 'AsyncSession', visits: 'asyncio.Queue[ImportedHistory | None]',
+                       committed: Callable[[], None]) -> None:
+    """Add history items from `visits` to the crawl job queue until `None` is received. Whatever is waiting in `visits`
+    is committed together, and `committed` is called after each commit."""
+    finished = False
+    while not finished:
+        chunk: list[ImportedHistory] = []
+        visit = await visits.get()
+        while visit is not None:
+            chunk.append(visit)
+            if len(chunk) >= _ENQUEUE_BATCH_SIZE or visits.empty():
+                break
+            visit = visits.get_nowait()
+        finished = visit is None
+        if chunk:
+            await enqueue(session, chunk)
+            committed()
+
+
+async def claim(session: 'AsyncSession', owner: str, limit: int) -> list[ImportedHistory]:
+    async with session.begin():
+        jobs = await CrawlJob.claim(session, owner, limit, _lease(), SETTINGS.crawl_max_attempts)
+        return [ImportedHistory.model_validate(job, from_attributes=True) for job in jobs]
+
+
+async def renew(session: 'AsyncSession', owner: str) -> None:
+    async with session.begin():
+        await CrawlJob.renew(session, owner, _lease())
+
+
+async def release(session: 'AsyncSession', owner: str | None = None) -> None:
+    async with session.begin():
+        await CrawlJob.release(session, owner)
+
+
+async def deferred(session: 'AsyncSession') -> bool:
+    """Whether any pending jobs have been deferred until later."""
+    async with session.begin():
+        return await CrawlJob.any_deferred(session)
+
+
+async def unfinished(session: 'AsyncSession') -> int:
+    """The number of jobs that are pending or in progress."""
+    async with session.begin():
+        counts = await CrawlJob.count_by_state(session)
+    return counts[JobState.PENDING] + counts[JobState.IN_PROGRESS]
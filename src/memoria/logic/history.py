@@ -1,12 +1,90 @@
-from typing import TYPE_CHECKING, AsyncIterable, Coroutine
+import asyncio
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, AsyncIterable, Coroutine, Sequence
 
+from ..batching import Batcher
 # from ..model.imported_history import History
+from ..model.orm.crawl_job import CrawlJob
 from ..model.orm.history import History
+from ..plugins.processing import Validators
+from ..settings import SETTINGS
 
 if TYPE_CHECKING:
     # from elasticsearch import AsyncElasticsearch
     from sqlalchemy.ext.asyncio import AsyncSession
 
+    from ..model.imported_history import ImportedHistory
+
 
 def get_history(session: 'AsyncSession', skip: int = 0, limit: int|None = None) -> Coroutine[None, None, AsyncIterable[History]]:
     return History.find_all(session, order_by=History.last_scrape, skip=skip, limit=limit)
+
+
+class HistoryWriter(Batcher[dict[str, Any], None]):
+    """Buffers history bookkeeping and writes it with a single upsert per batch. Writing an entry also finishes its crawl
+    job, which succeeded if it has a `last_scrape`. Deferring one instead returns its crawl job to the queue."""
+
+    def __init__(self, session: 'AsyncSession', lock: asyncio.Lock | None = None) -> None:
+        super().__init__(SETTINGS.history_batch_size, SETTINGS.history_batch_age, lock=lock)
+        self._session = session
+
+    async def write(self,
+                    history: 'ImportedHistory',
+                    last_scrape: datetime | None,
+                    validators: Validators | None = None) -> None:
+        await self.submit({
+            'url': history.url,
+            'title': history.title,
+            'last_visit': history.last_visit,
+            'last_scrape': last_scrape,
+            'etag': validators.etag if validators is not None else None,
+            'last_modified': validators.last_modified if validators is not None else None,
+        })
+
+    async def defer(self, history: 'ImportedHistory', delay: float) -> None:
+        """Have `history` downloaded again in `delay` seconds (at the earliest), without recording anything for it."""
+        await self.submit({'url': history.url, 'not_before': datetime.now() + timedelta(seconds=delay)})
+
+    async def _flush(self, items: list[dict[str, Any]]) -> Sequence[None]:
+        deferred = {row['url']: row['not_before'] for row in items if 'not_before' in row}
+        # A single upsert can't touch the same row twice, so merge duplicate URLs first.
+        rows: dict[str, dict[str, Any]] = {}
+        for row in items:
+            if 'not_before' in row:
+                continue
+            if (previous := rows.get(row['url'])) is not None and row['last_scrape'] is None:
+                row = {**row, **{key: previous[key] for key in ('last_scrape', 'etag', 'last_modified')}}
+            rows[row['url']] = row
+
+        async with self._session.begin():
+            await History.upsert_many(self._session, rows.values())
+            await CrawlJob.finish_many(self._session,
+                                       succeeded=(url for url, row in rows.items() if row['last_scrape'] is not None),
+                                       failed=(url for url, row in rows.items() if row['last_scrape'] is None))
+            await CrawlJob.defer_many(self._session, deferred, SETTINGS.crawl_max_attempts)
+        return [None] * len(items)
+
+
+class ValidatorReader(Batcher[str, Validators | None]):
+    """Looks up the stored cache validators of URLs with a single query per batch.
+
+    Pass the same `lock` as the `HistoryWriter` sharing this session, so that reads and writes don't overlap."""
+
+    def __init__(self, session: 'AsyncSession', lock: asyncio.Lock | None = None) -> None:
+        super().__init__(SETTINGS.history_batch_size, 0.05, lock=lock)
+        self._session = session
+
+    async def read(self, url: str) -> Validators | None:
+        return await self.submit(url)
+
+    async def _flush(self, items: list[str]) -> Sequence[Validators | None]:
+        from sqlalchemy import select
+
+        stmt = select(History.url, History.etag, History.last_modified).where(
+            History.url.in_(set(items)), (History.etag.is_not(None)) | (History.last_modified.is_not(None)))
+        async with self._session.begin():
+            found = {
+                url: Validators(etag=etag, last_modified=last_modified)
+                for url, etag, last_modified in await self._session.execute(stmt)
+            }
+        return [found.get(url) for url in items]
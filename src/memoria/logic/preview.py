@@ -1,12 +1,42 @@
+from collections import OrderedDict
 from typing import TYPE_CHECKING
 
+from ..search_cache import reindex_generation
+from ..settings import SETTINGS
+
 if TYPE_CHECKING:
-    from elasticsearch import AsyncElasticsearch
+    from ..backends import SearchBackend
+
+_CACHE: OrderedDict[str, tuple[int, str]] = OrderedDict()
+"""The most recently served previews (with the reindex generation they were read in), least recently used first."""
+
 
+def make_preview(text: str, length: int) -> str:
+    """A plain-text excerpt of (at most `length` characters from) the start of a page's extracted text, cut at a word
+    boundary. Runs of whitespace and unprintable characters are collapsed into single spaces."""
+    # Only the start of the text is needed, and pages can be long.
+    words = ''.join(c if c.isprintable() else ' ' for c in text[:length * 2]).split()
+    preview = ' '.join(words)
+    truncated = len(text) > length * 2
+    if len(preview) > length:
+        truncated = True
+        if (cut := preview.rfind(' ', 0, length)) <= length // 2:
+            # A very long word; cut it instead.
+            cut = length - 1
+        preview = preview[:cut]
+    return preview + '…' if truncated else preview
 
-async def get_preview(es: 'AsyncElasticsearch', id_: str) -> str:
-    resp = await es.get(index='pages', id=id_, source_includes=('preview',))
-    if not resp.get('found', False):
-        raise LookupError("No page with that ID exists.")
-    return resp['_source']['preview']
 
+async def get_preview(backend: 'SearchBackend', id_: str) -> str:
+    """The preview of a page, from an in-process LRU cache if it has been served recently (and pages haven't been
+    reindexed since, which can change it). Raises `LookupError` if there is no such page."""
+    generation = reindex_generation().value
+    if (cached := _CACHE.get(id_)) is not None and cached[0] == generation:
+        _CACHE.move_to_end(id_)
+        return cached[1]
+    preview = await backend.get_preview(id_)
+    _CACHE[id_] = generation, preview
+    _CACHE.move_to_end(id_)
+    while len(_CACHE) > SETTINGS.preview_cache_size:
+        _CACHE.popitem(last=False)
+    return preview
@@ -1,34 +1,40 @@
-from logging import getLogger
+from typing import TYPE_CHECKING
 
-from ..model.search_result import Result
-
-from urllib.parse import urlparse
-from typing import TYPE_CHECKING, AsyncGenerator
+from ..metrics import SEARCH_SECONDS
+from ..model.search_result import SearchResults
+from ..search_cache import SearchCache, index_generation
+from ..settings import SETTINGS
 
 if TYPE_CHECKING:
-    from elasticsearch import AsyncElasticsearch
+    from ..backends import SearchBackend
+    from ..model.explanation import Explanation
+
+_CACHE: SearchCache[tuple[str, int, str | None], SearchResults] | None = None
+
+
+def _cache() -> SearchCache[tuple[str, int, str | None], SearchResults]:
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = SearchCache(SETTINGS.search_cache_size, SETTINGS.search_cache_ttl, index_generation())
+    return _CACHE
+
 
-_LOG = getLogger(__spec__.name)
+def normalize_query(query: str) -> str:
+    """Queries differing only in case or whitespace are the same to every search backend."""
+    return ' '.join(query.lower().split())
 
 
-async def search(es: 'AsyncElasticsearch', query: str, size:int=25) -> AsyncGenerator[Result, None]:
-    resp = await es.search(index='pages', query={'match': {'text': query}}, explain=True, size=size, source_includes=('_id','title','url','timestamp', 'author', 'favicon', 'description'))
-    if 'hits' not in resp or 'hits' not in resp['hits'] or not isinstance(resp['hits']['hits'], list):
-        return
+async def search(backend: 'SearchBackend', query: str, size: int = 25, after: str | None = None) -> SearchResults:
+    """A page of results for `query`; the first, or the one following the page whose `cursor` is `after`. Raises
+    `ValueError` if `after` isn't a valid cursor."""
+    query = normalize_query(query)
 
-    for hit in resp['hits']['hits']:
-        source = hit['_source']
-        kwargs = {
-            '_id': hit['_id'],
-            'score': hit['_score'],
-            'basename': source['basename'] if 'basename' in source else urlparse(source['url']).hostname,
-            'explanation': {},
-            **hit['_source']
-        }
+    async def compute() -> SearchResults:
+        return await backend.search(query, size, after)
 
-        if hit['_explanation']['description'] == 'sum of:':
-            for detail in hit['_explanation']['details']:
-                kwargs['explanation'][detail['description'][12:].split(' in ', maxsplit=1)[0]] = detail['value']  # / resp['hits']['max_score']
+    with SEARCH_SECONDS.time():
+        return await _cache().get((query, size, after), compute)
 
-        yield Result(**kwargs)
 
+async def explain(backend: 'SearchBackend', id_: str, query: str) -> 'Explanation':
+    return await backend.explain(id_, query)
@@ -0,0 +1,79 @@
+import atexit
+import os
+import shutil
+import tempfile
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+    from .plugins._processing_manager import StageTiming
+
+# Metrics from every process (web, import workers, processing pools) are written to files in a shared directory, and
+# aggregated from there when scraped. This has to be set up before `prometheus_client` is imported. Child processes
+# inherit the environment, so only the first process to get here creates (and later removes) the directory.
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    _DIR = os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='memoria-metrics-')
+    _OWNER = os.getpid()
+
+    @atexit.register
+    def _remove_dir() -> None:
+        if os.getpid() == _OWNER:
+            shutil.rmtree(_DIR, ignore_errors=True)
+
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+
+DOWNLOADS = Counter('memoria_downloads', 'History items handled by the downloader, by outcome.', ['outcome'])
+DOWNLOADED_BYTES = Counter('memoria_downloaded_bytes', 'Bytes of content downloaded.')
+QUEUE_REMAINING = Gauge('memoria_queue_remaining',
+                        'Crawl jobs remaining in the running download.',
+                        multiprocess_mode='livesum')
+
+STAGE_SECONDS = Histogram('memoria_stage_seconds', 'Time spent in each processing plugin.', ['stage', 'plugin'])
+STAGE_CPU_SECONDS = Histogram('memoria_stage_cpu_seconds', 'CPU time used during each processing plugin call.',
+                              ['stage', 'plugin'])
+STAGE_BYTES = Counter('memoria_stage_bytes', 'Content passed into and out of each processing plugin.',
+                      ['stage', 'plugin', 'direction'])
+ELASTICSEARCH_SECONDS = Histogram('memoria_elasticsearch_seconds', 'Latency of Elasticsearch requests.', ['operation'])
+SQL_SECONDS = Histogram('memoria_sql_seconds', 'Latency of SQL statements.', ['operation'])
+SEARCH_SECONDS = Histogram('memoria_search_seconds', 'Latency of searches.')
+SEARCH_CACHE = Counter('memoria_search_cache', 'Search cache lookups, by result.', ['result'])
+
+_SQL_OPERATIONS = frozenset({'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'CREATE', 'ALTER', 'PRAGMA'})
+
+
+def render() -> tuple[bytes, str]:
+    """The metrics of every process, in the Prometheus text format, and its Content-Type."""
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def observe_stage(timing: 'StageTiming') -> None:
+    """A `ProcessingPluginManager` hook, aggregating stage timings per plugin."""
+    STAGE_SECONDS.labels(timing.stage, timing.plugin).observe(timing.wall_time)
+    STAGE_CPU_SECONDS.labels(timing.stage, timing.plugin).observe(timing.cpu_time)
+    if timing.input_size is not None:
+        STAGE_BYTES.labels(timing.stage, timing.plugin, 'in').inc(timing.input_size)
+    if timing.output_size is not None:
+        STAGE_BYTES.labels(timing.stage, timing.plugin, 'out').inc(timing.output_size)
+
+
+def instrument_engine(engine: 'AsyncEngine') -> None:
+    """Record the latency of every SQL statement executed by `engine`."""
+    from sqlalchemy import event
+
+    def before(conn, cursor, statement, parameters, context, executemany) -> None:
+        context._memoria_start = time.perf_counter()
+
+    def after(conn, cursor, statement: str, parameters, context, executemany) -> None:
+        operation = (statement.split(None, 1) or [''])[0].upper()
+        if operation not in _SQL_OPERATIONS:
+            operation = 'OTHER'
+        SQL_SECONDS.labels(operation).observe(time.perf_counter() - context._memoria_start)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', before)
+    event.listen(engine.sync_engine, 'after_cursor_execute', after)
@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+
+
+class Explanation(BaseModel):
+    """How (part of) a page's score for a query was computed, in the shape of Elasticsearch's explanations."""
+    value: float
+    description: str
+    details: list['Explanation'] = Field(default_factory=list)
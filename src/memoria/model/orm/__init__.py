@@ -1,8 +1,9 @@
 from typing import TYPE_CHECKING, Any, AsyncIterable, Self, Iterable
 
 from sqlalchemy import Column as Col
-from sqlalchemy import select, exists
+from sqlalchemy import select, exists, inspect, text
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncSession
 from sqlalchemy.orm import DeclarativeBase, load_only
 
@@ -16,6 +17,46 @@ class Column(Col):
         super().__init__(*args, **kwargs)
 
 
+UPSERT_DIALECTS = ('sqlite', 'postgresql')
+"""The database dialects `dialect_insert` supports, which are the only ones Memoria can use."""
+
+
+def check_dialect(name: str) -> None:
+    """Raise a `ValueError` if Memoria can't use databases of the given dialect."""
+    if name not in UPSERT_DIALECTS:
+        raise ValueError(f"Only SQLite and PostgreSQL databases are supported, not `{name}`; change the `database_uri` "
+                         "setting.")
+
+
+def dialect_insert(session: AsyncSession, table):
+    """Create an `INSERT` for the session's database dialect, which (unlike the generic one) supports upserts."""
+    check_dialect(name := session.bind.dialect.name)
+    if name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table)
+    from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+    return postgresql_insert(table)
+
+
+def create_schema(connection: Connection) -> None:
+    """Create any missing tables, and add any nullable columns that were introduced after a table was created (which
+    `create_all` doesn't do on its own)."""
+    CrudBase.metadata.create_all(connection)
+
+    inspector = inspect(connection)
+    quote = connection.dialect.identifier_preparer.quote
+    for table in CrudBase.metadata.sorted_tables:
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                raise RuntimeError(f"Cannot add non-nullable column `{column.name}` to existing table `{table.name}`.")
+            connection.execute(
+                text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} "
+                     f"{column.type.compile(connection.dialect)}"))
+
+
 class CrudBase(AsyncAttrs, DeclarativeBase):
     # @classmethod
     # def create(cls, db: Session, )
@@ -62,5 +103,6 @@ class CrudBase(AsyncAttrs, DeclarativeBase):
 from .history import *
 from .page import *
 from .allowlist import *
+from .crawl_job import *
 
 __all__ = tuple()
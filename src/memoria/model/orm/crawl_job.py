@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Iterable, Mapping
+
+from sqlalchemy import DateTime
+from sqlalchemy import Enum as SqlEnum
+from sqlalchemy import Integer, String, bindparam, case, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import Column, CrudBase, dialect_insert
+
+
+class JobState(str, Enum):
+    PENDING = 'pending'
+    IN_PROGRESS = 'in_progress'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class CrawlJob(CrudBase):
+    """A URL waiting to be (or that has been) downloaded and indexed.
+
+    Jobs are claimed by a downloader for a lease period. A job whose lease expires before it is finished (because the
+    downloader was stopped, for example) can be claimed again, up to a maximum number of attempts. A job can also be
+    deferred (when its host is failing, say), returning it to the pending state until a given time, which is kept in
+    `lease_expires` until it is claimed again."""
+    __tablename__ = 'crawl_jobs'
+
+    url = Column(String, primary_key=True)
+    title = Column(String, nullable=True)
+    last_visit = Column(DateTime)
+
+    state = Column(SqlEnum(JobState), default=JobState.PENDING, index=True)
+    attempts = Column(Integer, default=0)
+    owner = Column(String, nullable=True)
+    lease_expires = Column(DateTime, nullable=True)
+
+    @classmethod
+    async def enqueue_many(cls, session: AsyncSession, rows: Iterable[dict]) -> None:
+        """Add (or re-add) jobs with a single statement. Jobs that are currently in progress are left alone."""
+        if not (rows := list(rows)):
+            return
+        stmt = dialect_insert(session, cls).values([{**row, 'state': JobState.PENDING, 'attempts': 0} for row in rows])
+        busy = cls.state == JobState.IN_PROGRESS
+        stmt = stmt.on_conflict_do_update(index_elements=[cls.url],
+                                          set_={
+                                              'title': stmt.excluded.title,
+                                              'last_visit': stmt.excluded.last_visit,
+                                              'state': case((busy, cls.state), else_=stmt.excluded.state),
+                                              'attempts': case((busy, cls.attempts), else_=0),
+                                          })
+        await session.execute(stmt)
+
+    @classmethod
+    async def claim(cls, session: AsyncSession, owner: str, limit: int, lease: timedelta,
+                    max_attempts: int) -> list['CrawlJob']:
+        """Claim up to `limit` pending jobs (or in-progress jobs whose lease has expired) for `owner`. Expired jobs that
+        have run out of attempts are marked failed instead."""
+        now = datetime.now()
+        expired = (cls.state == JobState.IN_PROGRESS) & (cls.lease_expires < now)
+        await session.execute(
+            update(cls).where(expired, cls.attempts >= max_attempts).values(state=JobState.FAILED,
+                                                                            owner=None,
+                                                                            lease_expires=None))
+
+        pending = (cls.state == JobState.PENDING) & (cls.lease_expires.is_(None) | (cls.lease_expires <= now))
+        stmt = select(cls).where(or_(pending, expired)).limit(limit)
+        jobs = list((await session.execute(stmt.with_for_update(skip_locked=True))).scalars())
+        if jobs:
+            await session.execute(
+                update(cls).where(cls.url.in_([job.url for job in jobs])).values(state=JobState.IN_PROGRESS,
+                                                                                  attempts=cls.attempts + 1,
+                                                                                  owner=owner,
+                                                                                  lease_expires=now + lease))
+        return jobs
+
+    @classmethod
+    async def renew(cls, session: AsyncSession, owner: str, lease: timedelta) -> None:
+        """Extend the lease of every in-progress job claimed by `owner`."""
+        await session.execute(
+            update(cls).where(cls.owner == owner,
+                              cls.state == JobState.IN_PROGRESS).values(lease_expires=datetime.now() + lease))
+
+    @classmethod
+    async def release(cls, session: AsyncSession, owner: str | None = None) -> None:
+        """Return every in-progress job claimed by `owner` (or by anyone) to the pending state."""
+        stmt = update(cls).where(cls.state == JobState.IN_PROGRESS)
+        if owner is not None:
+            stmt = stmt.where(cls.owner == owner)
+        await session.execute(stmt.values(state=JobState.PENDING, owner=None, lease_expires=None))
+
+    @classmethod
+    async def defer_many(cls, session: AsyncSession, until: Mapping[str, datetime], max_attempts: int) -> None:
+        """Return jobs to the pending state, not to be claimed again before the given times. Jobs that have run out of
+        attempts are marked failed instead."""
+        if not until:
+            return
+        await session.execute(
+            update(cls).where(cls.url.in_(list(until)), cls.attempts >= max_attempts).values(state=JobState.FAILED,
+                                                                                          owner=None,
+                                                                                          lease_expires=None))
+        # On the session, a list of parameters would make this an ORM bulk update by primary key.
+        connection = await session.connection()
+        await connection.execute(
+            update(cls).where(cls.url == bindparam('job_url'),
+                              cls.attempts < max_attempts).values(state=JobState.PENDING,
+                                                                  owner=None,
+                                                                  lease_expires=bindparam('not_before')),
+            [{'job_url': url, 'not_before': not_before} for url, not_before in until.items()])
+
+    @classmethod
+    async def any_deferred(cls, session: AsyncSession) -> bool:
+        stmt = select(cls.url).where(cls.state == JobState.PENDING, cls.lease_expires.is_not(None)).limit(1)
+        return (await session.execute(stmt)).first() is not None
+
+    @classmethod
+    async def finish_many(cls, session: AsyncSession, succeeded: Iterable[str], failed: Iterable[str]) -> None:
+        for state, urls in ((JobState.DONE, list(succeeded)), (JobState.FAILED, list(failed))):
+            if urls:
+                await session.execute(
+                    update(cls).where(cls.url.in_(urls)).values(state=state, owner=None, lease_expires=None))
+
+    @classmethod
+    async def count_by_state(cls, session: AsyncSession) -> dict[JobState, int]:
+        stmt = select(cls.state, func.count()).group_by(cls.state)
+        return {state: 0 for state in JobState} | {state: count for state, count in await session.execute(stmt)}
+
+
+__all__ = tuple()
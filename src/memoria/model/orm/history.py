@@ -1,7 +1,10 @@
-from sqlalchemy import DateTime, String
+from typing import Any, Iterable
+
+from sqlalchemy import DateTime, String, case, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship
 
-from . import CrudBase, Column
+from . import CrudBase, Column, dialect_insert
 
 class History(CrudBase):
     __tablename__ = 'history'
@@ -10,7 +13,27 @@ class History(CrudBase):
     title = Column(String, nullable=True)
     last_visit = Column(DateTime)
     last_scrape = Column(DateTime, nullable=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
 
     pages = relationship("Page", back_populates="owner")
 
+    @classmethod
+    async def upsert_many(cls, session: AsyncSession, rows: Iterable[dict[str, Any]]) -> None:
+        """Insert or update many entries with a single statement. An existing `last_scrape` (and the `etag` and
+        `last_modified` validators that go with it) is kept unless a new one is given."""
+        if not (rows := list(rows)):
+            return
+        stmt = dialect_insert(session, cls).values(rows)
+        scraped = stmt.excluded.last_scrape.is_not(None)
+        stmt = stmt.on_conflict_do_update(index_elements=[cls.url],
+                                          set_={
+                                              'last_visit': stmt.excluded.last_visit,
+                                              'last_scrape': func.coalesce(stmt.excluded.last_scrape, cls.last_scrape),
+                                              'etag': case((scraped, stmt.excluded.etag), else_=cls.etag),
+                                              'last_modified': case((scraped, stmt.excluded.last_modified),
+                                                                    else_=cls.last_modified),
+                                          })
+        await session.execute(stmt)
+
 __all__ = tuple()
@@ -15,6 +15,7 @@ class Page(CrudBase):
     author = Column(String, nullable=True)
     favicon = Column(String, nullable=True)
     description = Column(String, nullable=True)
+    preview = Column(String, nullable=True)
 
     owner = relationship("History", back_populates="pages")
 
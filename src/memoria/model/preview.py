@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+class Preview(BaseModel):
+    id: str
+    text: str
+    """A plain-text excerpt of the start of the page."""
@@ -1,4 +1,4 @@
-from pydantic import Field
+from pydantic import BaseModel, Field
 
 from .page import Page
 
@@ -7,3 +7,11 @@ class Result(Page):
     score: float
     basename: str | None = None
     explanation: dict[str, float] = Field(default_factory=dict)
+    snippet: str | None = None
+    """HTML excerpt of the page's text around the matches, which are wrapped in `<mark>`."""
+
+
+class SearchResults(BaseModel):
+    results: list[Result]
+    cursor: str | None = None
+    """Opaque; pass it back to get the next page of results. Not set on the last page."""
@@ -12,6 +12,31 @@ from .allowlist import AllowlistRule, Hostname, InputItem
 
 T = TypeVar('T')
 
+_LOG = getLogger(__spec__.name)
+_IPV4_REGEX = re.compile(r"^(?:(?:25[0-5]|(?:2[0-4]|1[0-9]|[1-9]|)[0-9])(?:\.(?!$)|$)){4}$", flags=re.ASCII)
+_IPV6_REGEX = re.compile(IPV6_REGEX, flags=re.ASCII)
+
+
+def gen_hostnames(url: str, parse: 'ParseResult') -> Generator[InputItem, None, None]:
+    """Yield the hostname of `url`, followed by each of its parent domains (unless it is an IP address)."""
+    hostname = parse.hostname
+    if hostname is None:
+        _LOG.warning("Url `%s` has not hostname!", url)
+        return
+
+    item = Hostname(hostname), url, parse # InputItem(hostname, url, parse, False)
+    yield item
+
+    if _IPV4_REGEX.match(hostname) is not None or _IPV6_REGEX.match(hostname) is not None:
+        return
+
+    while True:
+        _, hostname = hostname.split('.', maxsplit=1)
+        if '.' not in hostname:
+            return
+        yield Hostname(hostname), url, parse
+
+
 class AllowlistPluginManager(AbstractAsyncContextManager):
     _LOG = getLogger(__module__ + '.AllowlistPluginManager')
     _rule_types: list[type[AllowlistRule]]
@@ -20,9 +45,6 @@ class AllowlistPluginManager(AbstractAsyncContextManager):
     _hostname_rule_cache: dict[Hostname, dict[str, set[str]] | None]
     _hostname_blocked_cache: dict[str, bool]
 
-    _ipv4regex = re.compile(r"^(?:(?:25[0-5]|(?:2[0-4]|1[0-9]|[1-9]|)[0-9])(?:\.(?!$)|$)){4}$", flags=re.ASCII)
-    _ipv6regex = re.compile(IPV6_REGEX, flags=re.ASCII)
-
     def __init__(self, rules: list[type[AllowlistRule]]) -> None:
         self._LOG.debug("Loaded allow/deny list rule types: [`%s`].", '`, `'.join(x.__name__ for x in rules))
         self._rule_types = rules
@@ -50,23 +72,7 @@ class AllowlistPluginManager(AbstractAsyncContextManager):
         self._rule_instances = {}
         return ret
 
-    def _gen_hostnames(self, url: str, parse: 'ParseResult') -> Generator[InputItem, None, None]:
-        hostname = parse.hostname
-        if hostname is None:
-            self._LOG.warning("Url `%s` has not hostname!", url)
-            return
-
-        item = Hostname(hostname), url, parse # InputItem(hostname, url, parse, False)
-        yield item
-
-        if self._ipv4regex.match(hostname) is not None or self._ipv6regex.match(hostname) is not None:
-            return
-
-        while True:
-            _, hostname = hostname.split('.', maxsplit=1)
-            if '.' not in hostname:
-                return
-            yield Hostname(hostname), url, parse
+    _gen_hostnames = staticmethod(gen_hostnames)
 
     async def _get_blocked(self, hostname: str) -> bool:
         from ..db_clients import get_sql_client
@@ -3,7 +3,7 @@ from logging import getLogger
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from ._processing_manager import ProcessingPluginManager
+    from ._processing_manager import ProcessingPluginManager, Stages
 
 from ..settings import SETTINGS
 from ..util import Singleton
@@ -18,6 +18,7 @@ class PluginSuite(metaclass=Singleton):
 
     def __init__(self) -> None:
         from .builtin.aiohttp_downloader import AiohttpDownloader
+        from .builtin.html_content_extractor import HtmlContentExtractor
         from .builtin.html_content_finder import HtmlContentFinder
         from .builtin.html_extractor import HtmlExtractor
         from .builtin.prefix_allowlistrule import PrefixAllowlistRule
@@ -25,6 +26,7 @@ class PluginSuite(metaclass=Singleton):
 
         self._modules = {
             'AiohttpDownloader': 'memoria.plugins.builtin.aiohttp_downloader',
+            'HtmlContentExtractor': 'memoria.plugins.builtin.html_content_extractor',
             'HtmlContentFinder': 'memoria.plugins.builtin.html_content_finder',
             'HtmlExtractor': 'memoria.plugins.builtin.html_extractor',
             'PrefixAllowlistRule': 'memoria.plugins.buitin.prefix_allowlistrule',
@@ -32,6 +34,7 @@ class PluginSuite(metaclass=Singleton):
         }
         self._plugins = {
             'AiohttpDownloader': AiohttpDownloader,
+            'HtmlContentExtractor': HtmlContentExtractor,
             'HtmlContentFinder': HtmlContentFinder,
             'HtmlExtractor': HtmlExtractor,
             'PrefixRule': PrefixAllowlistRule,
@@ -91,7 +94,14 @@ class PluginSuite(metaclass=Singleton):
         if errors:
             raise ExceptionGroup("Invalid configuration:", errors)
 
-    def create_processing_manager(self) -> 'ProcessingPluginManager':
-        from ._processing_manager import ProcessingPluginManager
-        return ProcessingPluginManager(self._plugins[SETTINGS.downloader], self._plugins[SETTINGS.extractor],
-                                       (self._plugins[name] for name in SETTINGS.filter_stack))
+    def create_processing_manager(self, stages: 'Stages | None' = None) -> 'ProcessingPluginManager':
+        from ._processing_manager import ProcessingPluginManager, Stages
+
+        extractor, filter_stack = SETTINGS.extractor, SETTINGS.filter_stack
+        if SETTINGS.fuse_html and extractor == 'HtmlExtractor' and filter_stack == ['HtmlContentFinder']:
+            _LOG.debug("Using `HtmlContentExtractor` in place of the equivalent built-in filter stack and extractor.")
+            extractor, filter_stack = 'HtmlContentExtractor', []
+
+        return ProcessingPluginManager(self._plugins[SETTINGS.downloader], self._plugins[extractor],
+                                       (self._plugins[name] for name in filter_stack),
+                                       stages if stages is not None else Stages.ALL)
@@ -1,11 +1,17 @@
-from contextlib import AbstractAsyncContextManager
+import time
+from contextlib import AbstractAsyncContextManager, contextmanager
+from dataclasses import asdict, dataclass
+from enum import Flag, auto
 from itertools import chain, pairwise
-from logging import getLogger
-from typing import Callable, Coroutine, Iterable, Self
+from logging import DEBUG, getLogger
+from typing import Any, Callable, Coroutine, Iterable, Iterator, Self, Sequence
 
+from ..batching import Batcher
+from ..metrics import DOWNLOADED_BYTES, observe_stage
 from ..model.imported_history import ImportedHistory
-from ..settings import SETTINGS
-from .processing import Downloader, Extractor, Filter, Plugin, Result
+from .processing import Downloader, Extractor, Filter, Plugin, Result, Validators
+
+_STAGE_LOG = getLogger(__spec__.name + '.stages')
 
 
 def _get_plugin_subclass(clazz: type) -> str:
@@ -22,17 +28,99 @@ def _get_plugin_subclass(clazz: type) -> str:
     return last.__name__
 
 
+@dataclass(slots=True, kw_only=True)
+class StageTiming:
+    """Describes a single call to a processing plugin."""
+    stage: str
+    """`download`, `filter`, `extract`, or `check_exists`."""
+    plugin: str
+    url: str
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    """The CPU time used by the whole process during the call, which includes other tasks on the event loop whenever the
+    plugin awaits something."""
+    input_size: int | None = None
+    """The length of the input content, if it's `str` or `bytes`."""
+    output_size: int | None = None
+    """The length of the output content, if it's `str` or `bytes`."""
+
+
+type StageHook = Callable[[StageTiming], None]
+
+
+def content_size(result: Result | None) -> int | None:
+    if result is not None and isinstance(result.content, (str, bytes)):
+        return len(result.content)
+    return None
+
+
+def log_stage(timing: StageTiming) -> None:
+    """Log each stage timing at debug level, with the timing attached to the record as `stage_timing`."""
+    if _STAGE_LOG.isEnabledFor(DEBUG):
+        _STAGE_LOG.debug("%s `%s` took %.1fms (%.1fms CPU) for `%s`, %s -> %s bytes.",
+                         timing.stage,
+                         timing.plugin,
+                         timing.wall_time * 1000,
+                         timing.cpu_time * 1000,
+                         timing.url,
+                         timing.input_size,
+                         timing.output_size,
+                         extra={'stage_timing': asdict(timing)})
+
+
+DEFAULT_HOOKS: tuple[StageHook, ...] = (log_stage, observe_stage)
+
+
+class _PluginBatcher(Batcher[Result, Result | None]):
+    """Groups Results for a Filter's `transform_many` or an Extractor's `extract_many`."""
+
+    def __init__(self, plugin: Filter | Extractor, call: Callable[..., Coroutine[None, None, list[Result]]],
+                 *args: Any) -> None:
+        super().__init__(plugin.batch_size, plugin.batch_age)
+        self._plugin = type(plugin).__name__
+        self._call = call
+        self._args = args
+
+    async def _flush(self, items: list[Result]) -> Sequence[Result | None]:
+        results = await self._call(items, *self._args)
+        if len(results) != len(items):
+            raise ValueError(f"`{self._plugin}` returned {len(results)} Results for a batch of {len(items)}.")
+        return results
+
+
+class Stages(Flag):
+    """The parts of processing a `ProcessingPluginManager` is used for. Only the plugins needed are created."""
+    DOWNLOAD = auto()
+    """Downloading (`download`)."""
+    PROCESS = auto()
+    """Filtering and extraction (`process`)."""
+    ALL = DOWNLOAD | PROCESS
+
+
 class ProcessingPluginManager(AbstractAsyncContextManager):
-    downloader: Downloader
+    downloader: Downloader | None
 
     wants: list[set[str]]
 
-    extractor: Extractor
+    extractor: Extractor | None
     filters: list[Filter]
+    hooks: list[StageHook]
+    """Called with the timing of every plugin call."""
+    batch_size: int
+    """The largest `batch_size` of the configured Filters and Extractor. Whoever runs `process` elsewhere (like a
+    `ProcessingPool`) should pass on this many Results at a time, so that batches can fill up."""
+    batch_age: float
+    _filter_batchers: list[_PluginBatcher | None]
+    _extract_batcher: _PluginBatcher | None
     _LOG = getLogger(__spec__.name + '.PluginProcessor')
 
-    def __init__(self, downloader: type[Downloader], extractor: type[Extractor],
-                 filters: Iterable[type[Filter]]) -> None:
+    def __init__(self,
+                 downloader: type[Downloader],
+                 extractor: type[Extractor],
+                 filters: Iterable[type[Filter]],
+                 stages: Stages = Stages.ALL,
+                 hooks: Iterable[StageHook] = DEFAULT_HOOKS) -> None:
+        filters = list(filters)
         errors = []
 
         if not issubclass(downloader, Downloader):
@@ -44,7 +132,7 @@ class ProcessingPluginManager(AbstractAsyncContextManager):
                 "Configured Extractor plugin is not valid: it's a "
                 f"`{_get_plugin_subclass(extractor)}` instead of an `Extractor`.", )
 
-        c_type: None | set[str] = self.downloader.content_types
+        c_type: None | set[str] = downloader.content_types
         for i, filter_ in enumerate(filters, start=1):
             if not issubclass(filter_, Filter):
                 errors.append(
@@ -60,8 +148,8 @@ class ProcessingPluginManager(AbstractAsyncContextManager):
                                f"plugin only produces [`{'`, `'.join(c_type)}`]."))
                 continue
 
-            _LOG.debug("\tFilter #%d: `%s` [`%s`] -> [`%s`]", i, filter_.__name__,
-                       '`, `'.join(c_type.intersection(filter_.accept)), '`, `'.join(filter_.content_types))
+            self._LOG.debug("\tFilter #%d: `%s` [`%s`] -> [`%s`]", i, filter_.__name__,
+                            '`, `'.join(c_type.intersection(filter_.accept)), '`, `'.join(filter_.content_types))
             c_type = filter_.content_types
 
         if c_type is None:
@@ -76,55 +164,133 @@ class ProcessingPluginManager(AbstractAsyncContextManager):
         if errors:
             raise ExceptionGroup("Invalid Processing plugin configuration.", errors)
 
-        self.downloader = downloader()
-        self.extractor = extractor()
-        self.filters = [f() for f in filters]
-
-        if not c_type.intersection(self.extractor.accept):
-            errors.append(
-                ValueError(f"Filter stack produces [`{'`, `'.join(c_type)}`], but selected Extractor "
-                           f"`{SETTINGS.extractor}` only accepts [`{'`, `'.join(extractor.accept)}`]."))
-
         self.wants = []
-        for left, right in pairwise(chain((self.downloader, ), self.filters, (self.extractor, ))):
-            assert not isinstance(left, Extractor)
-            assert not isinstance(right, Downloader)
+        for left, right in pairwise(chain((downloader, ), filters, (extractor, ))):
+            assert not issubclass(left, Extractor)
+            assert not issubclass(right, Downloader)
             self.wants.append(left.content_types.intersection(right.accept))
 
+        self.downloader = downloader() if Stages.DOWNLOAD in stages else None
+        self.extractor = extractor() if Stages.PROCESS in stages else None
+        self.filters = [f() for f in filters] if Stages.PROCESS in stages else []
+        self.hooks = list(hooks)
+
+        processing: list[type[Filter] | type[Extractor]] = [*filters, extractor]
+        batching = [plugin for plugin in processing if plugin.batch_size > 1]
+        self.batch_size = max((plugin.batch_size for plugin in batching), default=1)
+        self.batch_age = max((plugin.batch_age for plugin in batching), default=0.0)
+        self._filter_batchers = [None] * len(self.filters)
+        self._extract_batcher = None
+
     async def __aenter__(self) -> Self:
-        await self.downloader.__aenter__()
+        if self.downloader is not None:
+            await self.downloader.__aenter__()
         for filter_ in self.filters:
             await filter_.__aenter__()
-        await self.extractor.__aenter__()
+        if self.extractor is not None:
+            await self.extractor.__aenter__()
+
+        self._filter_batchers = [
+            _PluginBatcher(filter_, filter_.transform_many, wants) if filter_.batch_size > 1 else None for filter_, wants in zip(self.filters, self.wants[1:])
+        ]
+        if self.extractor is not None and self.extractor.batch_size > 1:
+            self._extract_batcher = _PluginBatcher(self.extractor, self.extractor.extract_many)
         return self
 
     async def __aexit__(self, *args, **kwargs) -> bool | None:
-        await self.extractor.__aexit__(*args, **kwargs)
+        for batcher in chain(self._filter_batchers, (self._extract_batcher, )):
+            if batcher is not None:
+                await batcher.flush()
+        self._filter_batchers = [None] * len(self.filters)
+        self._extract_batcher = None
+
+        if self.extractor is not None:
+            await self.extractor.__aexit__(*args, **kwargs)
         for filter_ in self.filters:
             await filter_.__aexit__(*args, **kwargs)
-        await self.downloader.__aexit__(*args, **kwargs)
+        if self.downloader is not None:
+            await self.downloader.__aexit__(*args, **kwargs)
         return None
 
-    async def process_one(self, history: ImportedHistory,
-                          check_exists: Callable[[Result], Coroutine[None, None, bool]]) -> Result | None:
-        result = await self.downloader.download(history.url, self.wants[0])
+    @contextmanager
+    def timed(self, stage: str, plugin: str, url: str, input_: Result | None = None) -> Iterator[StageTiming]:
+        """Time a plugin call, passing the timing to every hook afterwards. Set `output_size` on the timing yielded."""
+        timing = StageTiming(stage=stage, plugin=plugin, url=url, input_size=content_size(input_))
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield timing
+        finally:
+            timing.wall_time = time.perf_counter() - wall
+            timing.cpu_time = time.process_time() - cpu
+            for hook in self.hooks:
+                try:
+                    hook(timing)
+                except Exception:
+                    self._LOG.exception("Stage hook `%r` failed:", hook)
+
+    async def download(self, history: ImportedHistory, validators: Validators | None = None) -> Result | None:
+        """Download a history item. If `validators` are given and the Downloader supports conditional requests, an
+        unchanged resource produces a `not_modified` Result without any content."""
+        assert self.downloader is not None, "This manager was not created for the download stage."
+        with self.timed('download', type(self.downloader).__name__, history.url) as timing:
+            if validators is not None and self.downloader.conditional:
+                result = await self.downloader.download(history.url, self.wants[0], validators)
+            else:
+                result = await self.downloader.download(history.url, self.wants[0])
+            timing.output_size = content_size(result)
         if result is None:
             self._LOG.error("Could not download `%s`.", history.url)
             return None
-        if await check_exists(result):
-            self._LOG.info("URL `%s` has already been downloaded before, and the content is the same. Skipping.",
-                           history.url)
-            return None
+        if result.not_modified:
+            self._LOG.info("URL `%s` has not been modified since it was last downloaded. Skipping.", history.url)
+            return result
+        if result.retry_after is not None:
+            self._LOG.info("Downloading `%s` has been deferred for %.1f seconds.", history.url, result.retry_after)
+            return result
 
+        if isinstance(result.content, (str, bytes)):
+            DOWNLOADED_BYTES.inc(len(result.content))
         self._LOG.debug("Item downloaded, meta=%r", result.meta)
+        return result
 
-        for filter_, wants in zip(self.filters, self.wants[1:]):
-            result = await filter_.transform(result, wants)
-            if result is None:
+    async def process(self, result: Result) -> Result | None:
+        """Run a downloaded Result through the filter stack and the extractor. Plugins that take batches get this Result
+        together with those of concurrent calls, so their timings include the wait for a batch to fill up."""
+        assert self.extractor is not None, "This manager was not created for the process stage."
+        for filter_, wants, batcher in zip(self.filters, self.wants[1:], self._filter_batchers):
+            with self.timed('filter', type(filter_).__name__, result.url, result) as timing:
+                if batcher is not None:
+                    filtered = await batcher.submit(result)
+                else:
+                    filtered = await filter_.transform(result, wants)
+                timing.output_size = content_size(filtered)
+            if filtered is None:
                 self._LOG.error("Filter produced no output.")
                 return None
+            result = filtered
             self._LOG.debug("Item filtered, meta=%r", result.meta)
 
-        ret = await self.extractor.extract(result)
+        with self.timed('extract', type(self.extractor).__name__, result.url, result) as timing:
+            if self._extract_batcher is not None:
+                ret = await self._extract_batcher.submit(result)
+            else:
+                ret = await self.extractor.extract(result)
+            timing.output_size = content_size(ret)
         self._LOG.debug("Item extracted, meta=%r", result.meta)
         return ret
+
+    async def process_one(self,
+                          history: ImportedHistory,
+                          check_exists: Callable[[Result], Coroutine[None, None, bool]],
+                          validators: Validators | None = None) -> Result | None:
+        """Download and process a history item, unless `check_exists` finds its content has been seen before."""
+        result = await self.download(history, validators)
+        if result is None or result.not_modified:
+            return result
+        with self.timed('check_exists', check_exists.__name__, history.url, result):
+            exists = await check_exists(result)
+        if exists:
+            self._LOG.info("URL `%s` has already been downloaded before, and the content is the same. Skipping.",
+                           history.url)
+            return None
+        return await self.process(result)
@@ -0,0 +1,84 @@
+import random
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+"""HTTP statuses that are likely to be transient."""
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """The number of seconds a `Retry-After` header asks to wait (which may be given as a number or an HTTP date)."""
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+@dataclass(slots=True, frozen=True)
+class RetryPolicy:
+    """Exponential backoff with "full jitter": the `n`th retry waits a random time of up to `base * 2 ** n` seconds,
+    capped at `max_delay`."""
+    retries: int
+    base: float
+    max_delay: float
+
+    def delay(self, retry: int, retry_after: float | None = None) -> float | None:
+        """How long to wait before retry number `retry` (counting from `0`), or `None` if no more retries should be
+        made. A server-requested `retry_after` is honoured, unless it's longer than `max_delay`."""
+        if retry >= self.retries:
+            return None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base * 2**retry))
+
+
+@dataclass(slots=True)
+class _Circuit:
+    failures: int = 0
+    open_until: float = 0.0
+
+
+class CircuitBreaker:
+    """Tracks consecutive failures per hostname. After `threshold` of them, the host's circuit "opens" and no requests
+    are allowed for `cooldown` seconds. After that a single request is let through: if it succeeds the circuit closes
+    again, otherwise (or if it never reports back) it stays open for another cooldown."""
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self._threshold = max(1, threshold)
+        self._cooldown = cooldown
+        self._circuits: dict[str, _Circuit] = {}
+
+    def allow(self, host: str, now: float) -> bool:
+        """Whether a request may be sent to `host` at time `now`."""
+        if (circuit := self._circuits.get(host)) is None or circuit.failures < self._threshold:
+            return True
+        if circuit.open_until > now:
+            return False
+        circuit.open_until = now + self._cooldown
+        return True
+
+    def open_for(self, host: str, now: float) -> float:
+        """How long (in seconds) from `now` until a request may be sent to `host` again."""
+        if (circuit := self._circuits.get(host)) is None:
+            return 0.0
+        return max(0.0, circuit.open_until - now)
+
+    def success(self, host: str) -> None:
+        self._circuits.pop(host, None)
+
+    def failure(self, host: str, now: float, cooldown: float | None = None) -> None:
+        """Record a failed request to `host`. `cooldown` extends the time its circuit is opened for, for when the server
+        said how long it needs."""
+        circuit = self._circuits.setdefault(host, _Circuit())
+        circuit.failures += 1
+        if circuit.failures >= self._threshold:
+            circuit.open_until = now + max(self._cooldown, cooldown or 0.0)
@@ -1,22 +1,45 @@
+import asyncio
+from hashlib import sha256
 from logging import getLogger
-from typing import TYPE_CHECKING, Any, Coroutine, Self
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Self
 
 if TYPE_CHECKING:
-    from aiohttp import ClientSession
+    from aiohttp import ClientResponse, ClientSession
 
-from memoria.plugins.processing import Plugin, Downloader, Result
+from memoria.plugins.processing import Plugin, Downloader, Result, Validators
+from memoria.scheduler import host_key
+
+from ._http_policy import RETRY_STATUSES, CircuitBreaker, RetryPolicy, parse_retry_after
 
 HEADERS = {
     'User-Agent':
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/75.0.3770.100 Safari/537.36'
 }
 
+_CHUNK_SIZE = 64 * 1024
+_SNIFF_SIZE = 2048
+"""How much of a body libmagic looks at."""
+_MARKUP_TYPES = ('application/xhtml+xml', 'application/xml')
+"""Non-`text/*` MIME types libmagic may report for HTML."""
+
+
+def _validators(headers) -> Validators | None:
+    etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+    if etag is None and last_modified is None:
+        return None
+    return Validators(etag=etag, last_modified=last_modified)
+
 
 class AiohttpDownloader(Downloader):
     _session: 'ClientSession'
+    _max_bytes: int
+    _sniff: Callable[..., str] | None
+    _retry: RetryPolicy
+    _breaker: CircuitBreaker
     __log = getLogger(__spec__.name + '.AiohttpDownloader')
 
     content_types = {'text/html'}
+    conditional = True
 
     @classmethod
     def install_extra(cls) -> bool:
@@ -38,9 +61,36 @@ class AiohttpDownloader(Downloader):
         return True
 
     def __init__(self) -> None:
-        from aiohttp import ClientSession, TCPConnector
-        self._session = ClientSession(connector=TCPConnector(force_close=True, enable_cleanup_closed=True),
-                                      headers=HEADERS)
+        from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+        from memoria.settings import SETTINGS
+
+        connector: TCPConnector
+        if SETTINGS.download_pooling:
+            connector = TCPConnector(limit=SETTINGS.download_connection_limit,
+                                     limit_per_host=SETTINGS.download_connection_limit_per_host,
+                                     keepalive_timeout=SETTINGS.download_keepalive_timeout,
+                                     use_dns_cache=True,
+                                     ttl_dns_cache=SETTINGS.download_dns_cache_ttl)
+        else:
+            connector = TCPConnector(force_close=True, enable_cleanup_closed=True)
+
+        timeout = ClientTimeout(total=SETTINGS.download_total_timeout or None,
+                                sock_connect=SETTINGS.download_connect_timeout,
+                                sock_read=SETTINGS.download_read_timeout)
+        self._session = ClientSession(connector=connector, headers=HEADERS, timeout=timeout)
+        self._max_bytes = SETTINGS.download_max_bytes
+        self._retry = RetryPolicy(SETTINGS.download_retries, SETTINGS.download_retry_backoff,
+                                  SETTINGS.download_retry_max_delay)
+        self._breaker = CircuitBreaker(SETTINGS.download_breaker_threshold, SETTINGS.download_breaker_cooldown)
+
+        self._sniff = None
+        if SETTINGS.download_sniff:
+            try:
+                from magic import from_buffer
+                self._sniff = from_buffer
+            except ImportError:
+                self.__log.warning("libmagic could not be loaded, content will not be sniffed.", exc_info=True)
 
     async def __aenter__(self) -> Coroutine[Any, Any, Self]:
         await self._session.__aenter__()
@@ -51,30 +101,126 @@ class AiohttpDownloader(Downloader):
         await self._session.__aexit__(*args)
         return None
 
-    async def download(self, url: str, want_content_types: set[str]) -> Result | None:
-        if 'text/html' not in want_content_types:
-            raise ValueError(
-                f"This plugin does not produce `{content_type}`! Supported Content-Types are `{'`, `'.join(self.content_types)}`."
-            )
+    def _looks_like_html(self, url: str, head: bytes) -> bool:
+        assert self._sniff is not None
+        mime = self._sniff(head, mime=True)
+        if mime.startswith('text/') or mime in _MARKUP_TYPES:
+            return True
+        self.__log.warning("The content of `%s` looks like `%s` rather than HTML. Skipping.", url, mime)
+        return False
 
-        from aiohttp import ClientError, TooManyRedirects
-        try:
-            async with self._session.get(url) as response:
-                if response.status != 200:
-                    self.__log.warning("Got HTTP %d from `%s`.", response.status, url)
-                    return None
-                content_type: str = response.content_type
-                if not content_type.startswith('text/html'):
-                    self.__log.warning("Got non-HTML Content-Type `%s` from `%s`.", content_type, url)
+    async def _read(self, url: str, response: 'ClientResponse') -> tuple[bytes, str] | None:
+        """Read the body of `response` in chunks, hashing it along the way. Stops early (returning `None`) if it turns
+        out to be too large, or if its first bytes don't look like HTML."""
+        body = bytearray()
+        hasher = sha256()
+        sniffed = self._sniff is None
+        async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+            body += chunk
+            hasher.update(chunk)
+            if self._max_bytes and len(body) > self._max_bytes:
+                self.__log.warning("`%s` is more than the maximum of %d bytes. Skipping.", url, self._max_bytes)
+                return None
+            if not sniffed and len(body) >= _SNIFF_SIZE:
+                sniffed = True
+                if not self._looks_like_html(url, bytes(body[:_SNIFF_SIZE])):
                     return None
+        if not sniffed and body and not self._looks_like_html(url, bytes(body[:_SNIFF_SIZE])):
+            return None
+        return bytes(body), hasher.hexdigest()
+
+    async def download(self,
+                       url: str,
+                       want_content_types: set[str],
+                       validators: Validators | None = None) -> Result | None:
+        if 'text/html' not in want_content_types:
+            raise ValueError(f"This plugin does not produce `{'`, `'.join(want_content_types)}`! Supported "
+                             f"Content-Types are `{'`, `'.join(self.content_types)}`.")
+
+        headers = {}
+        if validators is not None:
+            if validators.etag is not None:
+                headers['If-None-Match'] = validators.etag
+            if validators.last_modified is not None:
+                headers['If-Modified-Since'] = validators.last_modified
+
+        from aiohttp import ClientConnectionError, ClientError, TooManyRedirects
+
+        host = host_key(url)
+        loop = asyncio.get_running_loop()
+        retry = 0
+        while True:
+            if not self._breaker.allow(host, loop.time()):
+                # Nothing is wrong with the URL itself, so it's tried again once the host has had time to recover.
+                cooldown = self._breaker.open_for(host, loop.time())
+                self.__log.warning("`%s` has failed too many times recently. Deferring `%s` for %.1f seconds.", host,
+                                   url, cooldown)
                 return Result(request_url=url,
-                              url=str(response.url),
-                              content=await response.read(),
+                              url=url,
+                              content=None,
                               content_type='text/html',
-                              encoding=response.get_encoding())
-        except TooManyRedirects:
-            self.__log.error("`%s` redirected too many times.", url)
+                              encoding=None,
+                              retry_after=cooldown)
+
+            retry_after: float | None = None
+            try:
+                async with self._session.get(url, headers=headers) as response:
+                    if response.status in RETRY_STATUSES:
+                        reason = f'HTTP {response.status}'
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    else:
+                        result = await self._result(url, response, headers, validators)
+                        self._breaker.success(host)
+                        return result
+            except TooManyRedirects:
+                self.__log.error("`%s` redirected too many times.", url)
+                return None
+            except TimeoutError:
+                reason = 'timed out'
+            except ClientConnectionError as ex:
+                reason = type(ex).__name__
+            except ClientError:
+                self.__log.exception("Unhandled exception while downloading `%s`:", url)
+                return None
+
+            self._breaker.failure(host, loop.time(), retry_after)
+            if (delay := self._retry.delay(retry, retry_after)) is None:
+                self.__log.warning("Could not download `%s` (%s). Giving up.", url, reason)
+                return None
+            self.__log.info("Could not download `%s` (%s). Retrying in %.1f seconds.", url, reason, delay)
+            await asyncio.sleep(delay)
+            retry += 1
+
+    async def _result(self, url: str, response: 'ClientResponse', headers: dict[str, str],
+                      validators: Validators | None) -> Result | None:
+        if response.status == 304 and headers:
+            # Not modified - don't read the body (there shouldn't be one anyways).
+            return Result(request_url=url,
+                          url=str(response.url),
+                          content=None,
+                          content_type='text/html',
+                          encoding=None,
+                          validators=_validators(response.headers) or validators,
+                          not_modified=True)
+        if response.status != 200:
+            self.__log.warning("Got HTTP %d from `%s`.", response.status, url)
+            return None
+        content_type: str = response.content_type
+        if not content_type.startswith('text/html'):
+            self.__log.warning("Got non-HTML Content-Type `%s` from `%s`.", content_type, url)
+            return None
+        if self._max_bytes and (response.content_length or 0) > self._max_bytes:
+            self.__log.warning("`%s` is %d bytes, more than the maximum of %d. Skipping.", url,
+                               response.content_length, self._max_bytes)
             return None
-        except ClientError:
-            self.__log.exception("Unhandled exception while downloading `%s`:", url)
+        if (body := await self._read(url, response)) is None:
             return None
+        content, content_hash = body
+        return Result(request_url=url,
+                      url=str(response.url),
+                      content=content,
+                      content_type='text/html',
+                      # Without a charset in the headers, the parser can look for one in the document itself.
+                      encoding=response.charset,
+                      validators=_validators(response.headers),
+                      content_hash=content_hash)
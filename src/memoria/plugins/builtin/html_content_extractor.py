@@ -0,0 +1,30 @@
+from memoria.html import ALLOWED_META, clean_html, extract_meta, get_backend
+from memoria.plugins.processing import Extractor, Result
+
+
+class HtmlContentExtractor(Extractor):
+    """Does the work of `HtmlContentFinder` and `HtmlExtractor` with a single parse of each page: metadata is read
+    first, and then the document is cleaned in place rather than in a copy."""
+
+    accept = {'text/html'}
+
+    async def extract(self, input_: Result) -> Result:
+        match input_.content_type, input_.content:
+            case 'text/html', (str() | bytes()):
+                pass
+            case _:
+                raise ValueError(f"This plugin does not accept `{input_.content_type}`, only `text/html`.")
+
+        backend = get_backend()
+        root = backend.parse(input_.content, input_.encoding)
+
+        attrs = dict(**input_.meta)
+        attrs.update(extract_meta(backend, root, input_.url, ALLOWED_META))
+
+        return Result(request_url=input_.request_url,
+                      url=input_.url,
+                      content=backend.text(clean_html(backend, root)),
+                      content_type='text/plain',
+                      encoding=None,
+                      meta=attrs,
+                      original=input_)
@@ -1,72 +1,59 @@
-import re
-from copy import deepcopy
 from logging import getLogger
 
-from bs4 import BeautifulSoup, Comment
+from bs4 import Tag
 
+from memoria.html import HTML_TREE, HtmlTree, SoupBackend, clean_html, extract_meta, get_backend
 from memoria.plugins.processing import Filter, Result
 
 _LOG = getLogger(__spec__.name)
 
 
-def find_one_of(soup: BeautifulSoup, element: str) -> BeautifulSoup:
-    _LOG.debug('looking for %s', element)
-    res: list[BeautifulSoup]
-    if (res := soup.find_all(element, limit=2)) and len(res) == 1:
-        _LOG.debug("Found a singular <%s> element. Scoping.", element)
-        return res[0]
-    return soup
-
-
-def clean_html(soup: BeautifulSoup) -> BeautifulSoup:
-    _LOG.debug('cleaning HTML')
-    [comment.extract() for comment in soup.findAll(string=lambda text: isinstance(text, Comment))]
-    [button.extract() for button in soup.find_all('a', {'role': 'button'})]
-    [match.extract() for match in soup.find_all({'form', 'input', 'nav'})]
-    [match.extract() for match in soup.find_all(class_='noprint')]
-
-    for header in soup(['header', 'script', 'style']):
-        header.decompose()
-
-    ret = soup
-    for element in ('main', 'article'):
-        ret = find_one_of(ret, element)
-
-    if (id_elem := ret.find_all(attrs={'id': re.compile('^content$', re.I)}, limit=2)) and len(id_elem) == 1:
-        _LOG.debug("Found a <... id='content'> element. Scoping.")
-        soup = id_elem[0]
-
-    return ret
-
-
 class HtmlContentFinder(Filter):
     __log = getLogger(__spec__.name + '.HtmlContentFinder')
 
-    accept = {'text/html', 'application/x-beautifulsoup'}
-    content_types = {'application/x-beautifulsoup'}
+    accept = {'text/html', 'application/x-beautifulsoup', HTML_TREE}
+    content_types = {HTML_TREE, 'application/x-beautifulsoup'}
 
     async def transform(self, input_: Result, want_content_types: set[str]) -> Result:
-        if 'application/x-beautifulsoup' not in want_content_types:
-            raise ValueError(
-                f"This plugin cannot produce [`{'`, `'.join(want_content_types)}`], only `application/x-beautifulsoup`."
-            )
+        if not want_content_types & self.content_types:
+            raise ValueError(f"This plugin cannot produce [`{'`, `'.join(want_content_types)}`], only "
+                             f"`{'`, `'.join(self.content_types)}`.")
 
-        bs: BeautifulSoup
+        # Plugins that only understand BeautifulSoup get BeautifulSoup, whatever parser is configured.
+        backend = get_backend()
+        if HTML_TREE not in want_content_types and not isinstance(backend, SoupBackend):
+            backend = get_backend('html.parser')
 
+        head: dict[str, str] | None = None
         match input_.content_type, input_.content:
             case 'text/html', (str() | bytes()):
-                bs = BeautifulSoup(input_.content, from_encoding=input_.encoding, features="html.parser")
-            case 'application/x-beautifulsoup', BeautifulSoup():
-                bs = input_.content
+                # A fresh parse, so it can be cleaned in place. Its metadata is captured first, so that the extractor
+                # doesn't need to parse the page again to find it.
+                node = backend.parse(input_.content, input_.encoding)
+                head = extract_meta(backend, node, input_.url)
+            case 'application/x-beautifulsoup', Tag():
+                backend = get_backend('html.parser')
+                node = backend.copy(input_.content)
+            case _, HtmlTree() if input_.content_type == HTML_TREE:
+                backend, head = input_.content.backend, input_.content.head
+                node = backend.copy(input_.content.node)
             case _:
-                raise ValueError(
-                    f"This plugin does not accept `{input_.content_type}`, only `text/html` and `application/x-beautifulsoup`."
-                )
+                raise ValueError(f"This plugin does not accept `{input_.content_type}`, only "
+                                 f"`{'`, `'.join(self.accept)}`.")
+
+        if HTML_TREE not in want_content_types and not isinstance(backend, SoupBackend):
+            raise ValueError(f"This plugin cannot produce `application/x-beautifulsoup` from a `{backend.name}` tree.")
+
+        node = clean_html(backend, node)
+        if HTML_TREE in want_content_types:
+            content, content_type = HtmlTree(backend, node, head), HTML_TREE
+        else:
+            content, content_type = node, 'application/x-beautifulsoup'
 
         return Result(request_url=input_.request_url,
                       url=input_.url,
-                      content=clean_html(deepcopy(bs)),
-                      content_type='application/x-beautifulsoup',
+                      content=content,
+                      content_type=content_type,
                       encoding=None,
                       meta=input_.meta,
                       original=input_)
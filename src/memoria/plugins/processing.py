@@ -5,6 +5,13 @@ from typing import Any, ClassVar, Optional
 from . import Plugin
 
 
+@dataclass(slots=True, frozen=True, kw_only=True)
+class Validators:
+    """HTTP cache validators of a downloaded resource, used to make conditional requests when re-downloading it."""
+    etag: str | None = None
+    last_modified: str | None = None
+
+
 @dataclass(slots=True, eq=False, repr=False, match_args=False, kw_only=True)
 class Result:
     """Describes the result of extraction or filtering."""
@@ -18,31 +25,65 @@ class Result:
     meta: dict[str, str] = field(default_factory=dict)
     original: Optional['Result'] = None
 
+    validators: Validators | None = None
+    """Set by Downloaders that support conditional requests."""
+    not_modified: bool = False
+    """Set by Downloaders when a conditional request found the resource unchanged, in which case `content` is `None`."""
+    content_hash: str | None = None
+    """The SHA-256 hex digest of `content`, if a Downloader computed it while downloading. Otherwise it's computed when
+    needed."""
+    retry_after: float | None = None
+    """Set by Downloaders that can't download the resource right now (because its host is failing, say) to how long (in
+    seconds) to wait before trying again, in which case `content` is `None`."""
+
 
 class _ProcessingPlugin(ABC):
     """Used purely for `issubclass(..., _ProcessingPlugin)` checks."""
 
 
+class _BatchingPlugin(ABC):
+    batch_size: ClassVar[int] = 1
+    """The most Results handed to the plugin's batch method at once. Above `1`, Memoria groups Results into batches for
+    it, so set this when overriding that method."""
+    batch_age: ClassVar[float] = 0.05
+    """The longest (in seconds) a Result waits for its batch to fill up."""
+
+
 class Downloader(Plugin, _ProcessingPlugin, ABC):
     content_types: ClassVar[set[str]]
+    conditional: ClassVar[bool] = False
+    """Whether `download` accepts the `validators` of a previous download to make a conditional request."""
 
     @abstractmethod
-    async def download(self, url: str, want_content_types: set[str]) -> Result | None:
+    async def download(self,
+                       url: str,
+                       want_content_types: set[str],
+                       validators: Validators | None = None) -> Result | None:
         """Download a given URL and produce the requested Content-Type, if possible."""
 
 
-class Extractor(Plugin, _ProcessingPlugin, ABC):
+class Extractor(Plugin, _ProcessingPlugin, _BatchingPlugin, ABC):
     accept: ClassVar[set[str]]
 
     @abstractmethod
     async def extract(self, input_: Result) -> Result:
         """Extract plain-text content from an input."""
 
+    async def extract_many(self, inputs: list[Result]) -> list[Result]:
+        """Extract plain-text content from several inputs, returning one output per input (in the same order). Calls
+        `extract` for each input by default; override it (and set `batch_size`) to share work between them."""
+        return [await self.extract(input_) for input_ in inputs]
+
 
-class Filter(Plugin, _ProcessingPlugin, ABC):
+class Filter(Plugin, _ProcessingPlugin, _BatchingPlugin, ABC):
     accept: ClassVar[set[str]]
     content_types: ClassVar[set[str]]
 
     @abstractmethod
     async def transform(self, input_: Result, want_content_types: set[str]) -> Result:
         """Transform the input in some way, producing the requested Content-Type."""
+
+    async def transform_many(self, inputs: list[Result], want_content_types: set[str]) -> list[Result]:
+        """Transform several inputs, returning one output per input (in the same order). Calls `transform` for each
+        input by default; override it (and set `batch_size`) to share work between them."""
+        return [await self.transform(input_, want_content_types) for input_ in inputs]
@@ -0,0 +1,97 @@
+import asyncio
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AbstractAsyncContextManager
+from typing import TYPE_CHECKING, Callable, Sequence
+
+from .batching import Batcher
+from .plugins.processing import Result
+
+if TYPE_CHECKING:
+    from .plugins._processing_manager import ProcessingPluginManager
+
+_LOOP: asyncio.AbstractEventLoop | None = None
+_MANAGER: 'ProcessingPluginManager | None' = None
+
+
+def _initialize() -> None:
+    from .downloader import _setup_logging
+    from .plugins._plugin_suite import PluginSuite
+    from .plugins._processing_manager import Stages
+
+    global _LOOP
+    global _MANAGER
+    _setup_logging()
+    _LOOP = asyncio.new_event_loop()
+    _MANAGER = PluginSuite().create_processing_manager(Stages.PROCESS)
+    _LOOP.run_until_complete(_MANAGER.__aenter__())
+
+
+def _process(result: Result) -> Result | None:
+    assert _LOOP is not None and _MANAGER is not None
+    ret = _LOOP.run_until_complete(_MANAGER.process(result))
+    if ret is not None:
+        # The chain of intermediate results can hold entire parse trees, which are expensive to send back.
+        ret.original = None
+    return ret
+
+
+async def _gather(results: list[Result]) -> list[Result | None | BaseException]:
+    assert _MANAGER is not None
+    return await asyncio.gather(*(_MANAGER.process(result) for result in results), return_exceptions=True)
+
+
+def _process_many(results: list[Result]) -> list[Result | None | BaseException]:
+    """Process several Results concurrently (so that plugins taking batches get them together). Each fails on its own,
+    with its exception returned in place of its output."""
+    assert _LOOP is not None
+    rets = _LOOP.run_until_complete(_gather(results))
+    for ret in rets:
+        if isinstance(ret, Result):
+            ret.original = None
+    return rets
+
+
+class _Batches(Batcher[Result, Result | None | BaseException]):
+    """Sends Results to the pool's processes in batches, one batch per process at a time."""
+
+    def __init__(self, pool: ProcessPoolExecutor, workers: int, batch_size: int, batch_age: float) -> None:
+        super().__init__(batch_size, batch_age, concurrency=workers)
+        self._pool = pool
+
+    async def _flush(self, items: list[Result]) -> Sequence[Result | None | BaseException]:
+        return await asyncio.get_running_loop().run_in_executor(self._pool, _process_many, items)
+
+
+class ProcessingPool(AbstractAsyncContextManager):
+    """Runs the filter and extractor stage of processing in separate processes, so that parsing doesn't hold up the
+    downloads on the caller's event loop (and vice versa).
+
+    At most `backlog` results (or batches of results) are queued for (or being) processed at once; further callers wait
+    for room. With a `batch_size` above `1` (for plugins that take batches), results are sent to the processes in batches
+    of up to that many, waiting at most `batch_age` seconds for a batch to fill up."""
+
+    def __init__(self, workers: int, backlog: int, batch_size: int = 1, batch_age: float = 0.0) -> None:
+        # Spawned rather than forked: the caller already has an event loop and client threads running.
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'),
+                                         initializer=_initialize)
+        self._backlog = asyncio.Semaphore(max(workers, backlog) * batch_size)
+        self._batches = _Batches(self._pool, workers, batch_size, batch_age) if batch_size > 1 else None
+
+    async def __aexit__(self, *_, **__) -> bool | None:
+        if self._batches is not None:
+            await self._batches.flush()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        return None
+
+    async def process(self, result: Result, queued: Callable[[], None] | None = None) -> Result | None:
+        """Filter and extract `result`. `queued` is called once there was room in the backlog for it."""
+        async with self._backlog:
+            if queued is not None:
+                queued()
+            if self._batches is None:
+                return await asyncio.get_running_loop().run_in_executor(self._pool, _process, result)
+            ret = await self._batches.submit(result)
+        if isinstance(ret, BaseException):
+            raise ret
+        return ret
@@ -0,0 +1,91 @@
+"""Processes every archived page again with the currently configured plugins, and indexes the results in place of the
+old ones. Nothing is downloaded. Run with:
+
+    python -m memoria.reindex [--workers N]
+"""
+import asyncio
+from argparse import ArgumentParser
+from logging import getLogger
+
+from .archive import Archive
+from .settings import SETTINGS
+
+_LOG = getLogger(__spec__.name)
+
+_REPORT_INTERVAL = 5.0
+"""How often (in seconds) progress is logged."""
+
+
+async def reindex(archive: Archive, workers: int) -> tuple[int, int]:
+    """Process every page in `archive`, in a pool of `workers` processes (or on this event loop, with `0`), and index
+    it. Returns how many pages were indexed, and how many failed."""
+    from .backends import create_search_backend
+    from .downloader import page_document
+    from .plugins._plugin_suite import PluginSuite
+    from .plugins._processing_manager import Stages
+    from .processing_pool import ProcessingPool
+    from .search_cache import index_generation, reindex_generation
+
+    processor = PluginSuite().create_processing_manager(Stages.PROCESS)
+    # So that a running web server stops serving the old versions of pages from its caches.
+    generations = index_generation(), reindex_generation()
+    pool: ProcessingPool | None = None
+    if workers > 0:
+        pool = ProcessingPool(workers, backlog=2 * workers, batch_size=processor.batch_size,
+                              batch_age=processor.batch_age)
+    # Enough pages in flight to keep the pool busy, and to fill index batches.
+    in_flight = asyncio.Semaphore(max(SETTINGS.index_batch_size, 2 * max(1, workers) * processor.batch_size))
+    indexed = failed = 0
+
+    async def one(id_: str) -> None:
+        nonlocal indexed, failed
+        try:
+            page = await asyncio.to_thread(archive.get, id_)
+            if pool is not None:
+                result = await pool.process(page.result())
+            else:
+                result = await processor.process(page.result())
+            if result is None:
+                _LOG.warning("The content of `%s` could not be processed.", page.request_url)
+            elif await search.index(id_, page_document(page.request_url, page.title, page.timestamp, result)):
+                for generation in generations:
+                    generation.bump()
+                indexed += 1
+                return
+            else:
+                _LOG.warning("The content of `%s` could not be indexed.", page.request_url)
+        except Exception:
+            _LOG.exception("Could not reindex `%s`:", id_)
+        finally:
+            in_flight.release()
+        failed += 1
+
+    loop = asyncio.get_running_loop()
+    last_report = loop.time()
+    async with create_search_backend() as search, pool or processor, asyncio.TaskGroup() as tasks:
+        # Listed in a thread, as the archive can hold a lot of files.
+        for id_ in await asyncio.to_thread(list, archive):
+            await in_flight.acquire()
+            tasks.create_task(one(id_))
+            if loop.time() - last_report >= _REPORT_INTERVAL:
+                last_report = loop.time()
+                _LOG.info("Reindexed %d pages (%d failed)...", indexed, failed)
+    return indexed, failed
+
+
+def main() -> None:
+    from .downloader import _setup_logging
+
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=SETTINGS.processing_workers,
+                        help='Processes to process pages in (or 0 to process them in this one).')
+    args = parser.parse_args()
+
+    _setup_logging()
+    indexed, failed = asyncio.run(reindex(Archive(SETTINGS.archive_dir), args.workers))
+    _LOG.info("Reindexed %d pages (%d failed).", indexed, failed)
+    exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Generic, TypeVar
+from urllib.parse import urlparse
+
+from .plugins._allowlist_manager import gen_hostnames
+
+T = TypeVar('T')
+
+
+def host_key(url: str) -> str:
+    """The hostname used to group `url` for politeness purposes (or `''` if it has none)."""
+    for hostname, *_ in gen_hostnames(url, urlparse(url)):
+        return hostname
+    return ''
+
+
+@dataclass(slots=True)
+class _Host(Generic[T]):
+    items: deque[T] = field(default_factory=deque)
+    in_flight: int = 0
+    not_before: float = 0.0
+
+
+class HostScheduler(Generic[T]):
+    """Hands out work round-robin across hostnames.
+
+    At most `per_host` items from the same hostname are in flight at once, and consecutive items from the same hostname
+    are handed out at least `delay` seconds apart. Callers must report each item handed out by `next` back through
+    `done` once it no longer counts against its host."""
+
+    def __init__(self, per_host: int, delay: float) -> None:
+        self._per_host = max(1, per_host)
+        self._delay = max(0.0, delay)
+        self._hosts: dict[str, _Host[T]] = {}
+        self._ready: deque[str] = deque()
+        self._pending = 0
+        self._in_flight = 0
+
+    @property
+    def pending(self) -> int:
+        """The number of items that have not been handed out yet."""
+        return self._pending
+
+    @property
+    def in_flight(self) -> int:
+        """The number of items that have been handed out but not reported `done`."""
+        return self._in_flight
+
+    def add(self, url: str, item: T) -> None:
+        hostname = host_key(url)
+        if (host := self._hosts.get(hostname)) is None:
+            host = self._hosts[hostname] = _Host()
+        if not host.items:
+            self._ready.append(hostname)
+        host.items.append(item)
+        self._pending += 1
+
+    def next(self, now: float) -> T | None:
+        """Hand out the next item whose host is allowed to receive more traffic at time `now`, if any."""
+        for _ in range(len(self._ready)):
+            hostname = self._ready.popleft()
+            host = self._hosts[hostname]
+            if host.in_flight >= self._per_host or host.not_before > now:
+                self._ready.append(hostname)
+                continue
+
+            item = host.items.popleft()
+            if host.items:
+                self._ready.append(hostname)
+            host.in_flight += 1
+            host.not_before = now + self._delay
+            self._pending -= 1
+            self._in_flight += 1
+            return item
+        return None
+
+    def wait_time(self, now: float) -> float | None:
+        """How long until `next` may return an item because of a host's delay, or `None` if no host is only waiting on
+        its delay."""
+        ret: float | None = None
+        for hostname in self._ready:
+            host = self._hosts[hostname]
+            if host.in_flight >= self._per_host:
+                continue
+            wait = max(0.0, host.not_before - now)
+            if ret is None or wait < ret:
+                ret = wait
+        return ret
+
+    def done(self, url: str) -> None:
+        hostname = host_key(url)
+        if (host := self._hosts.get(hostname)) is None or host.in_flight == 0:
+            return
+        host.in_flight -= 1
+        self._in_flight -= 1
+        if not host.items and host.in_flight == 0:
+            del self._hosts[hostname]
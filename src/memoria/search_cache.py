@@ -0,0 +1,151 @@
+import asyncio
+import atexit
+import os
+import struct
+import time
+from collections import OrderedDict
+from contextlib import AbstractContextManager
+from hashlib import blake2b
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Awaitable, Callable, Generic, Hashable, NamedTuple, Self, TypeVar
+
+from .metrics import SEARCH_CACHE
+from .settings import SETTINGS
+from .util import attach_shared_memory
+
+_COUNTER = struct.Struct('<Q')
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class IndexGeneration(AbstractContextManager):
+    """A counter, kept in shared memory, that processes bump whenever they index a page, so that search results cached
+    by another process can be told to be stale.
+
+    Processes bumping it at the same moment can lose a bump, which doesn't matter: only whether it has changed does. It
+    is never removed (it's only a few bytes), so that processes opening it by name share it whichever order they're
+    started in, and however they exit."""
+
+    def __init__(self, shm: SharedMemory) -> None:
+        assert shm.buf is not None
+        self._shm = shm
+        self._buf = shm.buf
+
+    @classmethod
+    def open(cls, name: str) -> Self:
+        """Open the counter called `name`, creating it if it doesn't exist yet."""
+        try:
+            # New shared memory is zeroed.
+            shm = SharedMemory(name, create=True, size=_COUNTER.size)
+        except FileExistsError:
+            return cls.attach(name)
+        if os.name == 'posix':
+            # Otherwise it's removed when this process exits.
+            resource_tracker.unregister(shm._name, 'shared_memory')  # type: ignore[attr-defined]
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name: str) -> Self:
+        """Attach to a counter opened (by `open`) in another process."""
+        return cls(attach_shared_memory(name))
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def value(self) -> int:
+        return _COUNTER.unpack_from(self._buf)[0]
+
+    def bump(self) -> None:
+        _COUNTER.pack_into(self._buf, 0, (self.value + 1) % 2**64)
+
+    def __exit__(self, *_, **__) -> bool | None:
+        self.close()
+        return None
+
+    def close(self) -> None:
+        self._shm.close()
+
+
+_GENERATIONS: dict[str, IndexGeneration] = {}
+
+
+def _generation(kind: str) -> IndexGeneration:
+    """A generation of the configured search index, opened on first use. Every process using the same index (like the
+    web server, and `memoria.reindex`) shares it."""
+    if (generation := _GENERATIONS.get(kind)) is None:
+        index = f'{SETTINGS.search_backend}\0{SETTINGS.database_uri}\0{SETTINGS.elastic_host}'
+        # Short enough for macOS, which allows 31 characters.
+        generation = IndexGeneration.open(f'memoria-{kind}-{blake2b(index.encode(), digest_size=6).hexdigest()}')
+        _GENERATIONS[kind] = generation
+        atexit.register(generation.close)
+    return generation
+
+
+def index_generation() -> IndexGeneration:
+    """Bumped whenever a page is indexed."""
+    return _generation('index')
+
+
+def reindex_generation() -> IndexGeneration:
+    """Bumped only when `memoria.reindex` replaces pages, which is the only way the page under an ID (being the hash of
+    its content) can change."""
+    return _generation('reindex')
+
+
+class _Entry(NamedTuple, Generic[V]):
+    expires: float
+    generation: int
+    value: V
+
+
+class SearchCache(Generic[K, V]):
+    """A size-bounded LRU cache of search results. Entries expire after `ttl` seconds, or as soon as `generation`
+    changes (as pages indexed since could be among the results). Concurrent lookups of the same missing key share a
+    single search. With a `size` of `0` nothing is cached (or shared).
+
+    Pages only become searchable once the search backend refreshes, which can be shortly after the generation has been
+    bumped; results cached in between are only corrected by `ttl`."""
+
+    def __init__(self, size: int, ttl: float, generation: IndexGeneration | None = None) -> None:
+        self._size = size
+        self._ttl = ttl
+        self._generation = generation
+        self._entries: OrderedDict[K, _Entry[V]] = OrderedDict()
+        self._pending: dict[K, asyncio.Future[V]] = {}
+
+    async def get(self, key: K, compute: Callable[[], Awaitable[V]]) -> V:
+        """The cached value for `key`, or else the value `compute` returns (which is then cached)."""
+        if self._size <= 0:
+            return await compute()
+
+        generation = self._generation.value if self._generation is not None else 0
+        if (entry := self._entries.get(key)) is not None:
+            if entry.expires > time.monotonic() and entry.generation == generation:
+                self._entries.move_to_end(key)
+                SEARCH_CACHE.labels('hit').inc()
+                return entry.value
+            del self._entries[key]
+
+        if (pending := self._pending.get(key)) is None:
+            SEARCH_CACHE.labels('miss').inc()
+            pending = self._pending[key] = asyncio.ensure_future(compute())
+            pending.add_done_callback(lambda future: self._done(key, generation, future))
+        else:
+            SEARCH_CACHE.labels('coalesced').inc()
+        # Shielded, so that one caller going away doesn't cancel the search for the others.
+        return await asyncio.shield(pending)
+
+    def _done(self, key: K, generation: int, future: asyncio.Future[V]) -> None:
+        if self._pending.get(key) is future:
+            del self._pending[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        # Stored under the generation from before the search, so that pages indexed during it invalidate it.
+        self._entries[key] = _Entry(time.monotonic() + self._ttl, generation, future.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
@@ -10,17 +10,67 @@ CPU_COUNT = cpu_count()
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(secrets_dir=SECRETS_DIR, env_prefix='memoria_')
 
-    elastic_password: str
+    elastic_password: str | None = None
     elastic_user: str = 'elastic'
     elastic_host: str = 'http://elasticsearch:9200/'
 
     database_uri: str = 'sqlite+aiosqlite:///./data/memoria.db'
+    search_backend: str = 'elasticsearch'
+
+    log_level: str = 'DEBUG'
 
     import_threads: int = CPU_COUNT // 2 if CPU_COUNT is not None else 1
+    import_concurrency: int = 16
+    host_concurrency: int = 2
+    host_delay: float = 1.0
+    processing_workers: int = CPU_COUNT if CPU_COUNT is not None else 1
+
+    index_batch_size: int = 200
+    index_batch_bytes: int = 10 * 1024 * 1024
+    index_batch_age: float = 2.0
+
+    history_batch_size: int = 500
+    history_batch_age: float = 1.0
+
+    crawl_lease: float = 300.0
+    crawl_max_attempts: int = 3
+
+    hash_index: bool = True
+    hash_index_error_rate: float = 0.01
+    hash_index_capacity: int = 100_000
+
+    archive: bool = True
+    archive_dir: Path = Path('./data/archive')
+
+    preview_length: int = 1000
+    preview_cache_size: int = 1024
+
+    search_cache_size: int = 256
+    search_cache_ttl: float = 60.0
+    snippet_size: int = 150
+    snippet_fragments: int = 2
+
+    download_pooling: bool = True
+    download_connection_limit: int = 100
+    download_connection_limit_per_host: int = 4
+    download_keepalive_timeout: float = 15.0
+    download_dns_cache_ttl: int = 300
+    download_connect_timeout: float = 10.0
+    download_read_timeout: float = 30.0
+    download_total_timeout: float = 300.0
+    download_max_bytes: int = 16 * 1024 * 1024
+    download_sniff: bool = True
+    download_retries: int = 3
+    download_retry_backoff: float = 1.0
+    download_retry_max_delay: float = 30.0
+    download_breaker_threshold: int = 5
+    download_breaker_cooldown: float = 60.0
 
     downloader: str = 'AiohttpDownloader'
     extractor: str = 'HtmlExtractor'
     filter_stack: list[str] = ['HtmlContentFinder']
+    html_parser: str = 'html.parser'
+    fuse_html: bool = True
 
     @classmethod
     def settings_customise_sources(cls, _, init_settings, env_settings, dotenv_settings, file_secret_settings) -> tuple[PydanticBaseSettingsSource, ...]:
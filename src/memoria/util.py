@@ -1,7 +1,10 @@
 import logging
+import sys
 from collections import UserString
 from contextlib import AbstractAsyncContextManager, AbstractContextManager
 from contextvars import ContextVar, Token
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 from typing import Generic, TypeVar
 
 
@@ -38,6 +41,22 @@ class set_context_var(AbstractContextManager, AbstractAsyncContextManager, Gener
         return self.__exit__(*args, **kwargs)
 
 
+def attach_shared_memory(name: str) -> SharedMemory:
+    """Attach to shared memory that another process created (and is responsible for removing).
+
+    Unlike `SharedMemory(name)`, this doesn't register it with the resource tracker: one this process doesn't share with
+    the creator would remove it (warning that it leaked) when this process exits, and unregistering it again instead
+    would take the creator's registration with it from one they do share."""
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name, track=False)  # type: ignore[call-arg]
+    register = resource_tracker.register
+    resource_tracker.register = lambda *_: None
+    try:
+        return SharedMemory(name)
+    finally:
+        resource_tracker.register = register
+
+
 _CSI = "\033[%sm"
 RESET = _CSI % 0
 """Special case: NOT a `ColorStr`."""
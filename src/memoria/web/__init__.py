@@ -14,6 +14,7 @@ except ImportError:
 from humanize import naturaltime
 
 from .. import MODULE_LOGGER
+from ..settings import SETTINGS
 from ..util import ColorFormatter
 from .lifecycle import lifespan
 # from .jinja import relative_time
@@ -30,7 +31,7 @@ APP = FastAPI(lifespan=lifespan)
 APP.add_middleware(CORSMiddleware, allow_origins=['*'], allow_credentials=False, allow_methods=['*'], allow_headers=['*', 'HX-Push-Url'])
 
 logger = MODULE_LOGGER
-logger.level = logging.DEBUG
+logger.setLevel(SETTINGS.log_level.upper())
 handler = logging.StreamHandler()
 handler.setLevel(logger.level)
 handler.setFormatter(ColorFormatter())
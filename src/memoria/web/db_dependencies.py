@@ -3,35 +3,34 @@ from typing import TYPE_CHECKING, Annotated, Optional
 
 from fastapi import Depends
 
-from ..settings import SETTINGS
-
 if TYPE_CHECKING:
-    from elasticsearch import AsyncElasticsearch
     from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 
-#### ElasticSearch ####
+    from ..backends import SearchBackend
 
-CLIENT: Optional['AsyncElasticsearch'] = None
+#### Search ####
 
+BACKEND: Optional['SearchBackend'] = None
 
-@asynccontextmanager
-async def es_lifecycle():
-    from elasticsearch import AsyncElasticsearch
 
-    basic_auth = (SETTINGS.elastic_user, SETTINGS.elastic_password)
+@asynccontextmanager
+async def search_lifecycle():
+    from ..backends import create_search_backend
 
-    global CLIENT
-    CLIENT = AsyncElasticsearch(SETTINGS.elastic_host, basic_auth=basic_auth)
-    yield
-    await CLIENT.close()
+    global BACKEND
+    # Indexes are created by the downloader, so that the server can start before Elasticsearch is up.
+    async with create_search_backend(create_indexes=False) as backend:
+        BACKEND = backend
+        yield
+    BACKEND = None
 
 
-async def get_elasticsearch() -> 'AsyncElasticsearch':
-    assert CLIENT is not None
-    return CLIENT
+async def get_search_backend() -> 'SearchBackend':
+    assert BACKEND is not None
+    return BACKEND
 
 
-Elasticsearch = Annotated['AsyncElasticsearch', Depends(get_elasticsearch)]
+Search = Annotated['SearchBackend', Depends(get_search_backend)]
 
 #### SQLAlchemy ####
 
@@ -52,17 +51,18 @@ SqlSession = Annotated['AsyncSession', Depends(get_session)]
 
 @asynccontextmanager
 async def sqlalchemy_lifecycle():
-    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.ext.asyncio import async_sessionmaker
 
-    from ..model.orm import CrudBase
+    from ..db_clients import create_sql_engine
+    from ..model.orm import create_schema
 
     global ENGINE
     global SESSION_MAKER
     try:
-        ENGINE = create_async_engine(SETTINGS.database_uri, connect_args={"check_same_thread": False})
+        ENGINE = create_sql_engine()
         SESSION_MAKER = async_sessionmaker(ENGINE, autocommit=False, autoflush=False, expire_on_commit=False)
         async with ENGINE.begin() as conn:
-            await conn.run_sync(CrudBase.metadata.create_all)
+            await conn.run_sync(create_schema)
         yield
     finally:
         await ENGINE.dispose()
@@ -7,6 +7,7 @@ __dependencies__ = (
     "fasthx~=0.2403.1",
     "fastapi~=0.111.0",
     "humanize~=4.9.0",
+    "prometheus-client~=0.20.0",
     "pydantic-settings~=2.2.1",
     "python-magic~=0.4.27",
     "SQLAlchemy[asyncio]~=2.0.30",
@@ -7,6 +7,11 @@ if TYPE_CHECKING:
 
 @asynccontextmanager
 async def lifespan(_: 'FastAPI'):
-    from .db_dependencies import es_lifecycle, sqlalchemy_lifecycle
-    async with es_lifecycle(), sqlalchemy_lifecycle():
+    from ..downloader import release_abandoned, run_downloader, stop_downloader
+    from .db_dependencies import search_lifecycle, sqlalchemy_lifecycle
+    async with search_lifecycle(), sqlalchemy_lifecycle():
+        # Resume any crawl jobs left unfinished when the server last stopped (or crashed).
+        await release_abandoned()
+        run_downloader()
         yield
+        await stop_downloader()
@@ -6,6 +6,7 @@ from .. import APP, TEMPLATES, WWW_ROOT
 HX = Jinja(TEMPLATES)
 
 from .about import *
+from .metrics import *
 
 # API Routes
 from .api import *
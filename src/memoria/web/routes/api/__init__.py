@@ -18,6 +18,7 @@ API = APIRouter(prefix='/api/v1')
 
 # Import routes
 from .history import *
+from .preview import *
 from .search import *
 from .upload_db import *
 from .allowlist import *
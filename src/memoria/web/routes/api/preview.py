@@ -0,0 +1,36 @@
+from hashlib import sha256
+
+from fastapi import HTTPException, Request, Response
+
+from ....logic.preview import get_preview
+from ....model.preview import Preview
+from ...db_dependencies import Search
+from .. import HX
+from . import API
+
+_RESPONSES = {200: {'content': {'text/html': {}}}, 304: {}, 404: {}}
+
+
+@API.get("/preview/{id}", response_model=Preview, responses=_RESPONSES)
+@HX.hx('preview.html.j2')
+async def api_preview(request: Request, response: Response, backend: Search, id: str):
+    try:
+        text = await get_preview(backend, id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="No page with that ID exists.") from None
+
+    # HTMX requests get HTML, others JSON, so each gets its own ETag.
+    representation = 'html' if request.headers.get('hx-request') == 'true' else 'json'
+    headers = {
+        # Previews only change on reindexing, but then browsers should notice; revalidating is cheap.
+        'Cache-Control': 'private, no-cache',
+        'ETag': '"{}-{}"'.format(sha256(text.encode()).hexdigest()[:32], representation),
+        'Vary': 'HX-Request',
+    }
+    if request.headers.get('if-none-match') == headers['ETag']:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return Preview(id=id, text=text)
+
+
+__all__ = tuple()
@@ -1,11 +1,13 @@
 from typing import Annotated
 from urllib.parse import quote_plus
 
-from fastapi import Form, Response
+from fastapi import Form, HTTPException, Response
+from fasthx import JinjaContext
 
-from ....logic.search import search
-from ....model.search_result import Result
-from ...db_dependencies import Elasticsearch
+from ....logic.search import explain, search
+from ....model.explanation import Explanation
+from ....model.search_result import SearchResults
+from ...db_dependencies import Search
 from .. import HX
 from . import API, HtmxHeader
 
@@ -20,15 +22,30 @@ _RESPONSES = {
 }
 
 
-@API.post("/search", response_model=list[Result], responses=_RESPONSES)
-@HX.hx('results.html.j2')
+@API.post("/search", response_model=SearchResults, responses=_RESPONSES)
+@HX.hx('results.html.j2', make_context=JinjaContext.unpack_result_with_route_context)
 async def api_search(response: Response,
-                     es: Elasticsearch,
+                     backend: Search,
                      query: Annotated[str, Form()],
-                     hx_request: HtmxHeader = None) -> list[Result]:
-    if hx_request is not None:
+                     after: Annotated[str | None, Form()] = None,
+                     hx_request: HtmxHeader = None) -> SearchResults:
+    """Search for `query`. To get the next page of results, pass the `cursor` of this page as `after`."""
+    try:
+        results = await search(backend, query, after=after)
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=str(ex)) from None
+    if hx_request is not None and after is None:
         response.headers['HX-Push-Url'] = '?q=' + quote_plus(query)
-    return [x async for x in search(es, query)]
+    return results
+
+
+@API.get("/explain/{id}", response_model=Explanation, responses={200: {'content': {'text/html': {}}}, 404: {}})
+@HX.hx('explanation.html.j2')
+async def api_explain(backend: Search, id: str, query: str) -> Explanation:
+    try:
+        return await explain(backend, id, query)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="No page with that ID exists.") from None
 
 
 __all__ = tuple()
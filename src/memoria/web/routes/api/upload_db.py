@@ -1,34 +1,31 @@
+import asyncio
 from datetime import datetime, timedelta
 from logging import getLogger
 from tempfile import NamedTemporaryFile
-from typing import TYPE_CHECKING, AsyncGenerator
+from typing import TYPE_CHECKING, Annotated, AsyncGenerator
 from pathlib import Path
 
 import aiofiles
-from fastapi import BackgroundTasks, HTTPException, UploadFile
+from fastapi import Depends, HTTPException, UploadFile
 
 from ....model.orm.history import History
 from ....settings import SETTINGS
-from ...db_dependencies import SqlSession
+from ...db_dependencies import SqlSession, get_session
 from .. import HX
 from . import API
 
 if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
 
     from ....model.imported_history import ImportedHistory
 
 CHUNK_SIZE = 1024 * 1024
+QUEUE_SIZE = 1_000
+"""The maximum number of filtered visits waiting to be added to the crawl job queue."""
 
 _LOG = getLogger(__spec__.name)
 
 
-async def _do_download(visits: list['ImportedHistory']) -> None:
-    from ....downloader import do_download
-    _LOG.info("Calling downloader")
-    await do_download(visits)
-    _LOG.info("Downloader done")
-
-
 async def _gen_mozilla(sqlite_file: 'Path') -> AsyncGenerator['ImportedHistory', None]:
     from ....model.history_db import MozPlace
     async for place in MozPlace.from_sqlite_file(sqlite_file):
@@ -65,7 +62,8 @@ def _gen_places(sqlite_file: 'Path') -> tuple[str, AsyncGenerator['ImportedHisto
 
 @API.post("/upload_db")
 @HX.hx('upload.html.j2')
-async def api_upload_db(file: UploadFile, background: BackgroundTasks, session: SqlSession):
+async def api_upload_db(file: UploadFile, session: SqlSession,
+                        jobs_session: Annotated['AsyncSession', Depends(get_session, use_cache=False)]):
     _LOG.debug("got upload!")
     tempfile = NamedTemporaryFile(delete_on_close=False)
 
@@ -82,7 +80,8 @@ async def api_upload_db(file: UploadFile, background: BackgroundTasks, session:
         raise HTTPException(422, "Failed to interpret upload as a known browser history database.")
     db_type, generator = ret
 
-    visits: list['ImportedHistory'] = []
+    visits: asyncio.Queue['ImportedHistory | None'] = asyncio.Queue(QUEUE_SIZE)
+    count = 0
     blocked = 0
     too_soon = 0
     total = 0
@@ -93,34 +92,41 @@ async def api_upload_db(file: UploadFile, background: BackgroundTasks, session:
     suite = PluginSuite()
     manager = AllowlistPluginManager([x for x in suite._plugins.values() if issubclass(x, AllowlistRule)])
 
-    async with manager:
-        async def gen_places():
-            nonlocal total
-            nonlocal blocked
-            nonlocal too_soon
-            async for place in generator:
-                total += 1
-                parse = urlparse(place.url)
-
-                if await manager.is_blocked(place.url, parse):
-                    blocked += 1
-                    continue
-
-                if await History.find_one(
-                        session, History.url == place.url, History.last_scrape >= before_date) is not None:
-                    too_soon += 1
-                    continue
-
-                yield place, place.url, parse
-
-            async for place in manager.process_rules(gen_places()):
-                visits.append(place)
-
-    _LOG.debug("Adding background task...")
-    background.add_task(_do_download, visits)
-    _LOG.debug("Returning...")
-    filtered = (total - len(visits)) - too_soon
-    return {'count': len(visits), 'total': total, 'filtered': filtered, 'too_soon': too_soon, 'type': db_type}
+    from ....downloader import feeding, run_downloader
+    from ....logic.crawl_jobs import enqueue_from
+
+    # Visits are added to the crawl job queue (and downloaded) while the rest are still being filtered.
+    with feeding():
+        async with asyncio.TaskGroup() as tasks:
+            tasks.create_task(enqueue_from(jobs_session, visits, committed=run_downloader))
+            async with manager:
+                async def gen_places():
+                    nonlocal total
+                    nonlocal blocked
+                    nonlocal too_soon
+                    async for place in generator:
+                        total += 1
+                        parse = urlparse(place.url)
+
+                        if await manager.is_blocked(place.url, parse):
+                            blocked += 1
+                            continue
+
+                        if await History.find_one(
+                                session, History.url == place.url, History.last_scrape >= before_date) is not None:
+                            too_soon += 1
+                            continue
+
+                        yield place, place.url, parse
+
+                async for place in manager.process_rules(gen_places()):
+                    count += 1
+                    await visits.put(place)
+            await visits.put(None)
+
+    _LOG.debug("Queued %d crawl jobs. Returning...", count)
+    filtered = (total - count) - too_soon
+    return {'count': count, 'total': total, 'filtered': filtered, 'too_soon': too_soon, 'type': db_type}
 
 
 __all__ = tuple()
@@ -1,16 +1,18 @@
-from ...model.search_result import Result
+from fasthx import JinjaContext
+
+from ...model.search_result import SearchResults
 from .. import APP
 from . import HX
 
 
 @APP.get('/')
-@HX.page('index.html.j2')
-async def index(q: str|None = None) -> list[Result]:
+@HX.page('index.html.j2', make_context=JinjaContext.unpack_result_with_route_context)
+async def index(q: str|None = None) -> SearchResults:
     if q is None:
-        return []
+        return SearchResults(results=[])
     from ...logic.search import search
-    from ..db_dependencies import get_elasticsearch
-    return [x async for x in search(await get_elasticsearch(), q)]
+    from ..db_dependencies import get_search_backend
+    return await search(await get_search_backend(), q)
 
 
 __all__ = tuple()
@@ -0,0 +1,13 @@
+from fastapi import Response
+
+from ...metrics import render
+from .. import APP
+
+
+@APP.get('/metrics', include_in_schema=False)
+def metrics() -> Response:
+    content, media_type = render()
+    return Response(content, media_type=media_type)
+
+
+__all__ = tuple()
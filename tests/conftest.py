@@ -0,0 +1,39 @@
+import asyncio
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from memoria.settings import SETTINGS
+
+
+@pytest.fixture
+def database_uri(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    """Point Memoria at an empty SQLite database of the test's own."""
+    uri = f'sqlite+aiosqlite:///{tmp_path / "memoria.db"}'
+    monkeypatch.setattr(SETTINGS, 'database_uri', uri)
+    return uri
+
+
+@pytest.fixture
+def with_session(database_uri: str) -> Callable[[Callable[[AsyncSession], Awaitable[None]]], None]:
+    """Run a coroutine function with a session on a database with Memoria's schema."""
+    from memoria.db_clients import create_sql_engine
+    from memoria.model.orm import create_schema
+
+    def run(test: Callable[[AsyncSession], Awaitable[None]]) -> None:
+
+        async def main() -> None:
+            engine = create_sql_engine()
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(create_schema)
+                async with AsyncSession(engine, expire_on_commit=False) as session:
+                    await test(session)
+            finally:
+                await engine.dispose()
+
+        asyncio.run(main())
+
+    return run
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from memoria.model.orm.crawl_job import CrawlJob, JobState
+
+_LEASE = timedelta(minutes=5)
+_EXPIRED = timedelta(seconds=-1)
+"""A lease that has already run out by the time it's claimed."""
+
+
+async def _enqueue(session: AsyncSession, *urls: str) -> None:
+    async with session.begin():
+        await CrawlJob.enqueue_many(session, ({'url': url, 'title': None, 'last_visit': datetime.now()} for url in urls))
+
+
+async def _claim(session: AsyncSession, owner: str, limit: int = 10, lease: timedelta = _LEASE,
+                 max_attempts: int = 3) -> set[str]:
+    async with session.begin():
+        return {job.url for job in await CrawlJob.claim(session, owner, limit, lease, max_attempts)}
+
+
+async def _states(session: AsyncSession) -> dict[JobState, int]:
+    async with session.begin():
+        return await CrawlJob.count_by_state(session)
+
+
+def test_claim_takes_each_job_once(with_session) -> None:
+
+    async def test(session: AsyncSession) -> None:
+        await _enqueue(session, 'http://a/1', 'http://a/2', 'http://a/3')
+        first = await _claim(session, 'first', limit=2)
+        second = await _claim(session, 'second')
+        assert len(first) == 2
+        assert first | second == {'http://a/1', 'http://a/2', 'http://a/3'}
+        assert not first & second
+        assert await _claim(session, 'third') == set()
+        assert (await _states(session))[JobState.IN_PROGRESS] == 3
+
+    with_session(test)
+
+
+def test_release_returns_jobs_to_pending(with_session) -> None:
+
+    async def test(session: AsyncSession) -> None:
+        await _enqueue(session, 'http://a/1', 'http://a/2')
+        first = await _claim(session, 'first', limit=1)
+        await _claim(session, 'second')
+
+        async with session.begin():
+            await CrawlJob.release(session, 'first')
+        assert await _claim(session, 'third') == first
+
+        async with session.begin():
+            await CrawlJob.release(session)
+        assert (await _states(session))[JobState.PENDING] == 2
+        assert len(await _claim(session, 'fourth')) == 2
+
+    with_session(test)
+
+
+def test_expired_lease_is_claimed_again(with_session) -> None:
+
+    async def test(session: AsyncSession) -> None:
+        await _enqueue(session, 'http://a/1')
+        assert await _claim(session, 'crashed', lease=_EXPIRED) == {'http://a/1'}
+        assert await _claim(session, 'next') == {'http://a/1'}
+        # The new lease hasn't expired.
+        assert await _claim(session, 'other') == set()
+
+        async with session.begin():
+            job = await session.get(CrawlJob, 'http://a/1', populate_existing=True)
+            assert job is not None
+            assert (job.owner, job.attempts) == ('next', 2)
+
+    with_session(test)
+
+
+def test_expired_lease_fails_after_max_attempts(with_session) -> None:
+
+    async def test(session: AsyncSession) -> None:
+        await _enqueue(session, 'http://a/1')
+        for _ in range(2):
+            assert await _claim(session, 'crashed', lease=_EXPIRED, max_attempts=2) == {'http://a/1'}
+        assert await _claim(session, 'next', max_attempts=2) == set()
+        assert (await _states(session))[JobState.FAILED] == 1
+
+    with_session(test)
+
+
+def test_deferred_job_waits_until_due(with_session) -> None:
+
+    async def test(session: AsyncSession) -> None:
+        await _enqueue(session, 'http://a/1', 'http://a/2')
+        await _claim(session, 'first')
+        async with session.begin():
+            await CrawlJob.defer_many(session, {
+                'http://a/1': datetime.now() + timedelta(hours=1),
+                'http://a/2': datetime.now() - timedelta(seconds=1)
+            }, max_attempts=3)
+            assert await CrawlJob.any_deferred(session)
+        assert await _claim(session, 'second') == {'http://a/2'}
+
+    with_session(test)
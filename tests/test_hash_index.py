@@ -0,0 +1,35 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from memoria.hash_index import HashIndex
+
+_CAPACITY = 20_000
+_ERROR_RATE = 0.01
+
+
+def _add(name: str, ids: list[str]) -> None:
+    with HashIndex.attach(name) as index:
+        for id_ in ids:
+            index.add(id_)
+
+
+def test_false_positive_rate_at_capacity() -> None:
+    with HashIndex.create(_CAPACITY, _ERROR_RATE) as index:
+        for i in range(_CAPACITY):
+            index.add(f'indexed-{i}')
+
+        assert all(f'indexed-{i}' in index for i in range(_CAPACITY))
+        false_positives = sum(f'new-{i}' in index for i in range(_CAPACITY))
+        # Hashing is deterministic, so this doesn't flake; the margin is for changes to how IDs are hashed.
+        assert false_positives / _CAPACITY < _ERROR_RATE * 1.5
+
+
+def test_attached_processes_share_the_index() -> None:
+    with HashIndex.create(1000, _ERROR_RATE) as index:
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            list(pool.map(_add, [index.name] * 2, [['a-1', 'a-2'], ['b-1']]))
+        assert all(id_ in index for id_ in ('a-1', 'a-2', 'b-1'))
+        assert 'c-1' not in index
+
+        # The workers detaching (and exiting) left it in place.
+        with HashIndex.attach(index.name) as again:
+            assert 'a-1' in again
@@ -0,0 +1,10 @@
+import pytest
+
+from memoria.model.orm import check_dialect
+
+
+def test_only_upsert_dialects_are_supported() -> None:
+    check_dialect('sqlite')
+    check_dialect('postgresql')
+    with pytest.raises(ValueError, match='database_uri'):
+        check_dialect('mysql')
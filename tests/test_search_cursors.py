@@ -0,0 +1,176 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import Any
+
+import pytest
+from elastic_transport import ApiResponseMeta, BaseAsyncNode, HttpHeaders
+from elastic_transport._node._base import NodeApiResponse
+
+from memoria.backends import SearchBackend, decode_cursor, encode_cursor
+
+_HEADERS = HttpHeaders({'x-elastic-product': 'Elasticsearch', 'content-type': 'application/json'})
+
+
+class _FakeNode(BaseAsyncNode):
+    """An Elasticsearch "node" holding `hits` matches for any query, which answers searches (with or without a point
+    in time) and the point-in-time requests around them."""
+    hits = 0
+    points_in_time: set[str] = set()
+    opened = 0
+
+    async def perform_request(self, method: str, target: str, body: bytes | None = None, headers=None,
+                              request_timeout=None) -> NodeApiResponse:
+        status, response = self._handle(method, target.partition('?')[0].strip('/').split('/'),
+                                        json.loads(body) if body else {})
+        meta = ApiResponseMeta(status=status, http_version='1.1', headers=_HEADERS, duration=0.0, node=self.config)
+        return NodeApiResponse(meta, json.dumps(response).encode())
+
+    async def close(self) -> None:
+        pass
+
+    def _handle(self, method: str, path: list[str], body: dict[str, Any]) -> tuple[int, Any]:
+        cls = type(self)
+        match method, path:
+            case _, [index, '_mapping']:
+                return 200, {index: {'mappings': {'properties': {'text': {'term_vector': 'with_positions_offsets'}}}}}
+            case 'POST', [_, '_pit']:
+                cls.opened += 1
+                cls.points_in_time.add(pit := f'pit-{cls.opened}')
+                return 200, {'id': pit}
+            case 'DELETE', ['_pit']:
+                found = body['id'] in cls.points_in_time
+                cls.points_in_time.discard(body['id'])
+                return (200 if found else 404), {'succeeded': found}
+            case _, ['_search'] | [_, '_search']:
+                if 'pit' in body and body['pit']['id'] not in cls.points_in_time:
+                    return 404, {'error': {'type': 'search_context_missing_exception'}, 'status': 404}
+                hits = [{
+                    '_id': f'page-{i}',
+                    '_score': cls.hits - i,
+                    'sort': [cls.hits - i, i],
+                    '_source': {
+                        'url': f'https://example.com/{i}',
+                        'title': f'Page {i}',
+                        'timestamp': '2024-01-01T00:00:00'
+                    }
+                } for i in range(cls.hits)]
+                if 'search_after' in body:
+                    hits = [hit for hit in hits if hit['sort'][1] > body['search_after'][1]]
+                hits = hits[body.get('from', 0):][:body['size']]
+                return 200, {'hits': {'hits': hits}} | ({'pit_id': body['pit']['id']} if 'pit' in body else {})
+        return 400, {'error': f'{method} /{"/".join(path)} is not supported by the fake Elasticsearch.'}
+
+
+@pytest.fixture
+def fake_elasticsearch(monkeypatch: pytest.MonkeyPatch) -> type[_FakeNode]:
+    import elasticsearch
+
+    class Client(elasticsearch.AsyncElasticsearch):
+
+        def __init__(self, *_, **__) -> None:
+            super().__init__('http://elasticsearch:9200', node_class=_FakeNode)
+
+    monkeypatch.setattr(elasticsearch, 'AsyncElasticsearch', Client)
+    monkeypatch.setattr(_FakeNode, 'hits', 0)
+    monkeypatch.setattr(_FakeNode, 'points_in_time', set())
+    monkeypatch.setattr(_FakeNode, 'opened', 0)
+    return _FakeNode
+
+
+async def _search_all(backend: SearchBackend, query: str, size: int) -> list[list[str]]:
+    """Page through every hit for `query`, returning the IDs on each page."""
+    pages = []
+    cursor = None
+    while True:
+        results = await backend.search(query, size, cursor)
+        pages.append([result.id for result in results.results])
+        if (cursor := results.cursor) is None:
+            return pages
+
+
+def test_cursor_is_tied_to_its_query() -> None:
+    cursor = encode_cursor('apple banana', {'after': [1, 2]})
+    assert decode_cursor(' Apple   BANANA', cursor)['after'] == [1, 2]
+    with pytest.raises(ValueError):
+        decode_cursor('apple', cursor)
+    with pytest.raises(ValueError):
+        decode_cursor('apple banana', 'not a cursor')
+
+
+def test_sqlite_cursors_page_through_every_hit(database_uri: str) -> None:
+    from memoria.backends.sqlite import SqliteBackend
+
+    async def test() -> None:
+        async with SqliteBackend() as backend:
+            await asyncio.gather(*(backend.index(
+                f'page-{i}', {
+                    'url': f'https://example.com/{i}',
+                    'title': f'Page {i}',
+                    'timestamp': datetime(2024, 1, 1),
+                    'text': 'apple ' * (i + 1) + 'banana'
+                }) for i in range(7)))
+
+            pages = await _search_all(backend, 'apple', 3)
+            assert [len(page) for page in pages] == [3, 3, 1]
+            ids = [id_ for page in pages for id_ in page]
+            assert sorted(ids) == sorted(f'page-{i}' for i in range(7))
+
+            first = await backend.search('apple', 3)
+            assert first.cursor is not None
+            second = await backend.search('APPLE ', 3, first.cursor)
+            assert [result.id for result in second.results] == pages[1]
+            with pytest.raises(ValueError):
+                await backend.search('banana', 3, first.cursor)
+
+    asyncio.run(test())
+
+
+def test_elasticsearch_cursors_page_through_every_hit(fake_elasticsearch: type[_FakeNode]) -> None:
+    from memoria.backends.elasticsearch import ElasticsearchBackend
+
+    async def test() -> None:
+        async with ElasticsearchBackend(create_indexes=False) as backend:
+            fake_elasticsearch.hits = 60
+            pages = await _search_all(backend, 'apple', 25)
+            assert [len(page) for page in pages] == [25, 25, 10]
+            assert [id_ for page in pages for id_ in page] == [f'page-{i}' for i in range(60)]
+            # Only the later pages came from a point in time, which was closed after the last one.
+            assert fake_elasticsearch.opened == 1
+            assert not fake_elasticsearch.points_in_time
+
+            first = await backend.search('apple', 25)
+            with pytest.raises(ValueError):
+                await backend.search('banana', 25, first.cursor)
+            assert fake_elasticsearch.opened == 1
+
+    asyncio.run(test())
+
+
+def test_elasticsearch_single_page_opens_no_point_in_time(fake_elasticsearch: type[_FakeNode]) -> None:
+    from memoria.backends.elasticsearch import ElasticsearchBackend
+
+    async def test() -> None:
+        async with ElasticsearchBackend(create_indexes=False) as backend:
+            fake_elasticsearch.hits = 25
+            assert await _search_all(backend, 'apple', 25) == [[f'page-{i}' for i in range(25)]]
+            assert fake_elasticsearch.opened == 0
+
+    asyncio.run(test())
+
+
+def test_elasticsearch_cursor_survives_an_expired_point_in_time(fake_elasticsearch: type[_FakeNode]) -> None:
+    from memoria.backends.elasticsearch import ElasticsearchBackend
+
+    async def test() -> None:
+        async with ElasticsearchBackend(create_indexes=False) as backend:
+            fake_elasticsearch.hits = 60
+            first = await backend.search('apple', 25)
+            second = await backend.search('apple', 25, first.cursor)
+            fake_elasticsearch.points_in_time.clear()
+            third = await backend.search('apple', 25, second.cursor)
+            assert [result.id for result in third.results] == [f'page-{i}' for i in range(50, 60)]
+            assert third.cursor is None
+            assert not fake_elasticsearch.points_in_time
+
+    asyncio.run(test())
@@ -0,0 +1,31 @@
+import re
+
+from memoria.backends.sqlite import _MATCH_END, _MATCH_START, _fragments
+
+_FILLER = ' '.join(f'filler{i}' for i in range(40))
+
+
+def _marked(text: str) -> str:
+    """Mark `*word`s the way FTS5's `highlight` marks matches."""
+    return re.sub(r'\*(\S+)', f'{_MATCH_START}\\1{_MATCH_END}', text)
+
+
+def test_fragments_prefer_the_most_distinct_words_in_document_order() -> None:
+    fragments = _fragments(_marked(f'*apple {_FILLER} *banana and *apple {_FILLER} *apple'), 60, 2)
+    assert len(fragments) == 2
+    assert fragments[0].startswith(_marked('*apple filler0'))
+    assert _marked('*banana and *apple') in fragments[1]
+    assert all(len(fragment.replace(_MATCH_START, '').replace(_MATCH_END, '')) <= 60 for fragment in fragments)
+
+
+def test_fragments_do_not_overlap() -> None:
+    text = _marked(f'*apple pie and *apple tart {_FILLER}')
+    assert _fragments(text, 150, 3) == [text[:150].rpartition(' ')[0]]
+    assert _fragments('no matches here', 150, 2) == []
+
+
+def test_fragments_never_cut_a_highlight_in_half() -> None:
+    text = f'some words {_MATCH_START}a long highlighted phrase{_MATCH_END} and more'
+    for fragment in _fragments(text, 12, 2):
+        assert fragment.count(_MATCH_START) == fragment.count(_MATCH_END) == 1
+        assert fragment.index(_MATCH_START) < fragment.index(_MATCH_END)